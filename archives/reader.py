@@ -0,0 +1,262 @@
+import zlib
+import struct
+import typing
+import tarfile
+
+ZIP_LOCAL_FILE_SIGNATURE = b'PK\x03\x04'
+ZIP_DATA_DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+ZIP_CENTRAL_DIRECTORY_SIGNATURES = (b'PK\x01\x02', b'PK\x05\x06', b'PK\x06\x06')
+ZIP_STORED, ZIP_DEFLATED = 0, 8
+ZIP64_EXTRA_ID = 0x0001
+TAR_BLOCK_SIZE = tarfile.BLOCKSIZE
+# Decompressed data is produced in slices of this size, so a single small chunk can not blow up the memory.
+INFLATE_SLICE_SIZE = 1 << 20
+
+
+class ArchiveError(ValueError):
+    """
+    Error raised when the archive can not be read any further.
+    """
+    pass
+
+
+class MemberError(ValueError):
+    """
+    Error of the single member, the following members are still read.
+    """
+    pass
+
+
+class MemberTooLargeError(MemberError):
+    """
+    Error of the member exceeding the allowed size, its data is skipped.
+    """
+    pass
+
+
+class Member(typing.NamedTuple):
+    """
+    File extracted from the archive, data is None when the member could not be extracted.
+    """
+    name: str
+    data: typing.Optional[bytes]
+    error: typing.Optional[MemberError] = None
+
+
+class ArchiveReader:
+    """
+    Class extracting the files of ZIP or TAR archive incrementally, while the archive is still being received.
+
+    Chunks of the archive are fed as they arrive and the members are returned as soon as
+    their data is complete, so only the member being extracted is buffered and not the whole
+    archive. Archives are read sequentially through the local headers: the ZIP central
+    directory (at the end of the archive) is never needed, members with the data descriptor
+    are supported when deflated. Directories, links and other special members are skipped.
+
+    Members larger than max_member_size are skipped (reported with MemberTooLargeError),
+    so the memory used by the reader is bounded by the size of the largest member allowed.
+    """
+    allowed_formats = ('zip', 'tar')
+
+    def __init__(self, archive_format: str, max_member_size: int):
+        if archive_format not in ArchiveReader.allowed_formats:
+            raise NotImplementedError
+        self.max_member_size = max_member_size
+        self.__buffer = bytearray()
+        self.__closed = False
+        self.__finished = False
+        self.__parser = self.__zip_members() if archive_format == 'zip' else self.__tar_members()
+
+    def feed(self, chunk: bytes) -> typing.Iterator[Member]:
+        """
+        Add the next chunk of the archive.
+
+        :param chunk: bytes of the archive following the previously fed ones.
+        :return: iterator over the members completed by the chunk.
+        """
+        if not self.__finished:
+            self.__buffer += chunk
+        return self.__members()
+
+    def close(self) -> typing.Iterator[Member]:
+        """
+        Finish the archive, it fails when the archive was truncated.
+
+        :return: iterator over the remaining members.
+        """
+        self.__closed = True
+        return self.__members()
+
+    def __members(self) -> typing.Iterator[Member]:
+        # Parser yields None whenever it needs more data than the buffer holds.
+        for member in self.__parser:
+            if member is None:
+                return
+            yield member
+        # Data following the end of the archive is dropped.
+        self.__finished = True
+        self.__buffer.clear()
+
+    def __read(self, size: int) -> typing.Generator[None, None, bytes]:
+        while len(self.__buffer) < size:
+            if self.__closed:
+                raise ArchiveError('Archive is truncated')
+            yield None
+        data = bytes(self.__buffer[:size])
+        del self.__buffer[:size]
+        return data
+
+    def __skip(self, size: int) -> typing.Generator[None, None, None]:
+        # Skipped data is dropped as it arrives, so it is never buffered as a whole.
+        while size > 0:
+            if not self.__buffer:
+                if self.__closed:
+                    raise ArchiveError('Archive is truncated')
+                yield None
+                continue
+            skipped = min(size, len(self.__buffer))
+            del self.__buffer[:skipped]
+            size -= skipped
+
+    def __at_end(self) -> typing.Generator[None, None, bool]:
+        while not self.__buffer and not self.__closed:
+            yield None
+        return not self.__buffer
+
+    def __inflate(self) -> typing.Generator[None, None, typing.Tuple[typing.Optional[bytes], int, int]]:
+        # Deflate stream marks its own end, so the member is read even without the sizes known up front.
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        data, size, crc = bytearray(), 0, 0
+        while not decompressor.eof:
+            if not self.__buffer:
+                if self.__closed:
+                    raise ArchiveError('Archive is truncated')
+                yield None
+                continue
+            pending = bytes(self.__buffer)
+            self.__buffer.clear()
+            try:
+                while pending and not decompressor.eof:
+                    output = decompressor.decompress(pending, INFLATE_SLICE_SIZE)
+                    pending = decompressor.unconsumed_tail
+                    size += len(output)
+                    crc = zlib.crc32(output, crc)
+                    if data is not None and size <= self.max_member_size:
+                        data += output
+                    else:
+                        # The rest of the oversized member is inflated only to find its end.
+                        data = None
+            except zlib.error as e:
+                raise ArchiveError(f'Archive member is corrupted: {e}')
+            self.__buffer[:0] = decompressor.unused_data if decompressor.eof else pending
+        return (bytes(data) if data is not None else None), size, crc
+
+    def __zip_members(self) -> typing.Generator[typing.Optional[Member], None, None]:
+        while True:
+            signature = yield from self.__read(4)
+            if signature in ZIP_CENTRAL_DIRECTORY_SIGNATURES:
+                # Central directory only repeats the local headers, the rest of the archive is ignored.
+                return
+            if signature != ZIP_LOCAL_FILE_SIGNATURE:
+                raise ArchiveError('Archive is not a valid ZIP archive')
+            header = yield from self.__read(26)
+            _, flags, method, _, _, crc, compressed_size, size, name_length, extra_length = \
+                struct.unpack('<HHHHHIIIHH', header)
+            name = (yield from self.__read(name_length)).decode('utf-8' if flags & 0x800 else 'cp437')
+            extra = yield from self.__read(extra_length)
+            size, compressed_size, zip64 = ArchiveReader.__zip64_sizes(extra, size, compressed_size)
+            has_descriptor = bool(flags & 0x08)
+            if has_descriptor and method != ZIP_DEFLATED:
+                raise ArchiveError(f'{name} member size is unknown, it can not be read from the stream')
+            error = None
+            if flags & 0x01:
+                error = MemberError(f'{name} member is encrypted')
+            elif method not in (ZIP_STORED, ZIP_DEFLATED):
+                error = MemberError(f'{name} member compression method {method} is not supported')
+            elif not has_descriptor and size > self.max_member_size:
+                error = MemberTooLargeError(f'{name} member exceeds {self.max_member_size} bytes')
+            if error is not None and has_descriptor:
+                raise ArchiveError(f'{error}, its size is unknown, so the archive can not be read further')
+            if error is not None:
+                yield from self.__skip(compressed_size)
+            elif method == ZIP_STORED:
+                data = yield from self.__read(compressed_size)
+                size = len(data)
+                data_crc = zlib.crc32(data)
+            else:
+                data, size, data_crc = yield from self.__inflate()
+                if data is None:
+                    error = MemberTooLargeError(f'{name} member exceeds {self.max_member_size} bytes')
+            if has_descriptor:
+                descriptor = yield from self.__read(4)
+                if descriptor == ZIP_DATA_DESCRIPTOR_SIGNATURE:
+                    descriptor = yield from self.__read(4)
+                crc = struct.unpack('<I', descriptor)[0]
+                yield from self.__read(16 if zip64 else 8)
+            if error is None and data_crc != crc:
+                error = MemberError(f'{name} member is corrupted, its checksum does not match')
+            if name.endswith('/'):
+                continue
+            yield Member(name, None, error) if error is not None else Member(name, data)
+
+    @staticmethod
+    def __zip64_sizes(extra: bytes, size: int, compressed_size: int) -> typing.Tuple[int, int, bool]:
+        offset = 0
+        while offset + 4 <= len(extra):
+            field_id, field_length = struct.unpack_from('<HH', extra, offset)
+            if field_id == ZIP64_EXTRA_ID:
+                values = iter(struct.unpack_from(f'<{field_length // 8}Q', extra, offset + 4))
+                # Only the sizes overflowing the local header are stored in the field, in this order.
+                if size == 0xFFFFFFFF:
+                    size = next(values, size)
+                if compressed_size == 0xFFFFFFFF:
+                    compressed_size = next(values, compressed_size)
+                return size, compressed_size, True
+            offset += 4 + field_length
+        return size, compressed_size, False
+
+    def __tar_members(self) -> typing.Generator[typing.Optional[Member], None, None]:
+        long_name = None
+        while True:
+            if (yield from self.__at_end()):
+                # Archive may end without the closing zero blocks.
+                return
+            block = yield from self.__read(TAR_BLOCK_SIZE)
+            try:
+                info = tarfile.TarInfo.frombuf(block, 'utf-8', 'surrogateescape')
+            except tarfile.EOFHeaderError:
+                return
+            except tarfile.HeaderError as e:
+                raise ArchiveError(f'Archive is not a valid TAR archive: {e}')
+            padded_size = -(-info.size // TAR_BLOCK_SIZE) * TAR_BLOCK_SIZE
+            if info.type in (tarfile.GNUTYPE_LONGNAME, tarfile.XHDTYPE):
+                # Names not fitting the header are stored in the preceding special member.
+                data = yield from self.__read(padded_size)
+                name = data[:info.size].rstrip(b'\0').decode('utf-8', 'surrogateescape') \
+                    if info.type == tarfile.GNUTYPE_LONGNAME \
+                    else ArchiveReader.__pax_path(data[:info.size])
+                long_name = name or long_name
+                continue
+            name, long_name = long_name or info.name, None
+            if not info.isreg():
+                yield from self.__skip(padded_size)
+            elif info.size > self.max_member_size:
+                yield from self.__skip(padded_size)
+                yield Member(name, None, MemberTooLargeError(f'{name} member exceeds {self.max_member_size} bytes'))
+            else:
+                data = yield from self.__read(padded_size)
+                yield Member(name, data[:info.size])
+
+    @staticmethod
+    def __pax_path(data: bytes) -> typing.Optional[str]:
+        # Records of the extended header are "<length> <keyword>=<value>\n".
+        offset = 0
+        while offset < len(data):
+            length, _, rest = data[offset:].partition(b' ')
+            if not length.isdigit() or int(length) == 0:
+                return None
+            keyword, _, value = rest[:int(length) - len(length) - 2].partition(b'=')
+            if keyword == b'path':
+                return value.decode('utf-8', 'surrogateescape')
+            offset += int(length)
+        return None
@@ -0,0 +1,93 @@
+import io
+import time
+import typing
+import tarfile
+import zipfile
+import tempfile
+import posixpath
+import threading
+
+
+class ArchiveWriter:
+    """
+    Class writing the converted files into ZIP or TAR archive sent as the response.
+
+    Files are written as soon as they are converted, into the spooled temporary file:
+    it is kept in memory up to spool_size bytes and moved to the disk afterwards, so the
+    memory used by the output does not grow with the number of files. PNG and JPEG files
+    are compressed already, so the ZIP members are stored without compression.
+
+    Names are normalised (no absolute paths or parent directory references) and made
+    unique, so the archive can be safely extracted by the client. Writes are serialised
+    with the lock, so the files may be added from several threads.
+    """
+    media_types = {'zip': 'application/zip', 'tar': 'application/x-tar'}
+
+    def __init__(self, archive_format: str, spool_size: int):
+        if archive_format not in ArchiveWriter.media_types:
+            raise NotImplementedError
+        self.archive_format = archive_format
+        self.__file = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        self.__archive = zipfile.ZipFile(self.__file, 'w', zipfile.ZIP_STORED) \
+            if archive_format == 'zip' \
+            else tarfile.open(fileobj=self.__file, mode='w', format=tarfile.PAX_FORMAT)
+        self.__names = set()
+        self.__lock = threading.Lock()
+
+    @property
+    def media_type(self) -> str:
+        return ArchiveWriter.media_types[self.archive_format]
+
+    def add(self, name: str, data: bytes) -> str:
+        """
+        Write the file into the archive.
+
+        :param name: requested name of the file.
+        :param data: content of the file.
+        :return: name of the file in the archive.
+        """
+        with self.__lock:
+            name = self.__unique(ArchiveWriter.__normalise(name))
+            if self.archive_format == 'zip':
+                self.__archive.writestr(zipfile.ZipInfo(name, time.localtime()[:6]), data)
+            else:
+                info = tarfile.TarInfo(name)
+                info.size, info.mtime, info.mode = len(data), int(time.time()), 0o644
+                self.__archive.addfile(info, io.BytesIO(data))
+            return name
+
+    def stream(self, chunk_size: int) -> typing.Iterator[bytes]:
+        """
+        Finish the archive and read it in chunks, the temporary file is removed afterwards.
+
+        :param chunk_size: size of the chunks.
+        :return: iterator over the chunks of the archive.
+        """
+        try:
+            with self.__lock:
+                self.__archive.close()
+            self.__file.seek(0)
+            while chunk := self.__file.read(chunk_size):
+                yield chunk
+        finally:
+            self.__file.close()
+
+    def close(self):
+        # File being still written by another thread is closed once the write is finished.
+        with self.__lock:
+            self.__archive.close()
+            self.__file.close()
+
+    def __unique(self, name: str) -> str:
+        stem, extension = posixpath.splitext(name)
+        counter = 1
+        while name in self.__names:
+            counter += 1
+            name = f'{stem}-{counter}{extension}'
+        self.__names.add(name)
+        return name
+
+    @staticmethod
+    def __normalise(name: str) -> str:
+        parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.', '..')]
+        return '/'.join(parts) or 'unnamed'
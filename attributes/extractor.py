@@ -0,0 +1,23 @@
+from abc import ABC, abstractmethod
+
+import pydicom
+
+
+class Extractor(ABC):
+    # DICOM keywords of the elements read by the extractor, they are the only
+    # elements parsed when the attributes are read without the pixel data.
+    tags = ()
+
+    @staticmethod
+    @abstractmethod
+    def extract(dataset: pydicom.Dataset):
+        """
+        Abstract method allowing to extract the attribute from DICOM dataset.
+
+        It is the base method for all the implementations
+        of attribute extractors.
+
+        :param dataset: parsed DICOM dataset.
+        :return: JSON serializable value of the attribute.
+        """
+        pass
@@ -0,0 +1,17 @@
+import pydicom
+
+from attributes.extractor import Extractor
+
+
+class ImageSizeExtractor(Extractor):
+    tags = ('Columns', 'Rows')
+
+    @staticmethod
+    def extract(dataset: pydicom.Dataset) -> list:
+        """
+        Extract the size of the image.
+
+        :param dataset: parsed DICOM dataset.
+        :return: list containing width and height of the image.
+        """
+        return [dataset.Columns, dataset.Rows]
@@ -0,0 +1,17 @@
+import pydicom
+
+from attributes.extractor import Extractor
+
+
+class PixelSpacingExtractor(Extractor):
+    tags = ('PixelSpacing',)
+
+    @staticmethod
+    def extract(dataset: pydicom.Dataset) -> float:
+        """
+        Extract the pixel spacing (row spacing) of the image.
+
+        :param dataset: parsed DICOM dataset.
+        :return: pixel spacing in millimeters.
+        """
+        return dataset.PixelSpacing[0]
@@ -1,15 +1,65 @@
 import typing
 import pydicom
+from pydicom.datadict import tag_for_keyword
+from pydicom.multival import MultiValue
+from pydicom.valuerep import PersonName
+
+from attributes.extractors.image_size import ImageSizeExtractor
+from attributes.extractors.pixel_spacing import PixelSpacingExtractor
 
 
 class AttributesReader:
     """
-    Class enabling to read attributes of DICOM image provided as BinaryIO.
+    Class enabling to read attributes of parsed DICOM dataset.
+
+    Every attribute is read by its own extractor, so new attributes
+    can be added by registering the extractor under the attribute name.
+    Attributes which have no extractor registered are read as the DICOM
+    elements with the matching keyword (e.g. 'Modality').
     """
+    extractors = {
+        'pixel_spacing': PixelSpacingExtractor,
+        'image_size': ImageSizeExtractor
+    }
+
+    @staticmethod
+    def read_attributes(dataset: pydicom.Dataset, names: typing.Iterable[str] = None) -> dict:
+        return {
+            name: extractor.extract(dataset)
+            if (extractor := AttributesReader.extractors.get(name)) is not None
+            else AttributesReader.__read_keyword(dataset, name)
+            for name in (names if names is not None else AttributesReader.extractors)
+        }
+
+    @staticmethod
+    def supports(name: str) -> bool:
+        return name in AttributesReader.extractors or tag_for_keyword(name) is not None
+
+    @staticmethod
+    def tags(names: typing.Iterable[str] = None) -> typing.List[str]:
+        """
+        Collect the DICOM keywords of the elements necessary to read the attributes.
+
+        :param names: names of the attributes, all registered ones by default.
+        :return: list of DICOM keywords.
+        """
+        tags = []
+        for name in (names if names is not None else AttributesReader.extractors):
+            extractor = AttributesReader.extractors.get(name)
+            tags.extend(extractor.tags if extractor is not None else (name,))
+        return tags
+
+    @staticmethod
+    def __read_keyword(dataset: pydicom.Dataset, keyword: str) -> typing.Any:
+        return AttributesReader.__to_json(dataset.get(keyword))
+
     @staticmethod
-    def read_attributes(dcm_decompressed_bytes: typing.BinaryIO) -> dict:
-        with pydicom.dcmread(dcm_decompressed_bytes, force=True) as im:
-            return {
-                'pixel_spacing': im.PixelSpacing[0],
-                'image_size': [im.Columns, im.Rows]
-            }
+    def __to_json(value: typing.Any) -> typing.Any:
+        if isinstance(value, (MultiValue, list, tuple)):
+            return [AttributesReader.__to_json(item) for item in value]
+        if isinstance(value, (int, float, str)) or value is None:
+            return value
+        if isinstance(value, PersonName):
+            return str(value)
+        # Binary values and sequences are not exposed as attributes.
+        return None
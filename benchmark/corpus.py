@@ -0,0 +1,174 @@
+import io
+import os
+import bz2
+import gzip
+import lzma
+import zlib
+import base64
+import typing
+import itertools
+
+import numpy as np
+import pydicom
+from PIL import Image
+from pydicom.dataset import FileMetaDataset
+from pydicom.encaps import encapsulate
+from pydicom.uid import ExplicitVRLittleEndian, ImplicitVRLittleEndian, RLELossless, JPEGBaseline8Bit, generate_uid
+
+from compression.methods.lzw import LZString
+from parsing.parser import Parser
+
+SYNTAXES = {
+    'explicit': ExplicitVRLittleEndian,
+    'implicit': ImplicitVRLittleEndian,
+    'rle': RLELossless,
+    'jpeg': JPEGBaseline8Bit
+}
+CODECS = {
+    'zlib': zlib.compress,
+    'gzip': gzip.compress,
+    'lzma': lzma.compress,
+    'bz2': bz2.compress
+}
+COMPRESSIONS = ('lz', *CODECS, 'none')
+
+
+class Case(typing.NamedTuple):
+    """
+    Single synthetic DICOM of the corpus.
+    """
+    size: int
+    bits: int
+    frames: int
+    syntax: str
+
+    @property
+    def name(self) -> str:
+        return f'{self.size}x{self.size}-{self.bits}bit-{self.frames}f-{self.syntax}'
+
+    @property
+    def supported(self) -> bool:
+        # Baseline JPEG is defined only for 8 bit samples.
+        return self.syntax != 'jpeg' or self.bits == 8
+
+
+def cases(
+        sizes: typing.Iterable[int],
+        bits: typing.Iterable[int],
+        frames: typing.Iterable[int],
+        syntaxes: typing.Iterable[str]
+) -> typing.List[Case]:
+    """
+    Build the cases of the corpus as the product of the parameters, skipping unsupported ones.
+    """
+    products = itertools.product(sizes, bits, frames, syntaxes)
+    return [case for case in itertools.starmap(Case, products) if case.supported]
+
+
+def generate(case: Case, seed: int = 0) -> bytes:
+    """
+    Generate the synthetic DICOM file of the case.
+
+    Pixels are the smooth gradient with the noise, so they compress like the real images
+    rather than like the constant ones. The same seed always generates the same bytes.
+
+    :param case: parameters of the image.
+    :param seed: seed of the pixel noise.
+    :return: bytes of the DICOM file.
+    """
+    rng = np.random.default_rng(seed)
+    maximum = (1 << (12 if case.bits == 16 else 8)) - 1
+    gradient = np.add.outer(np.arange(case.size), np.arange(case.size)) * (maximum / (2 * case.size))
+    pixels = np.stack([
+        np.clip(np.roll(gradient, 8 * frame, axis=1) + rng.normal(0, maximum / 64, gradient.shape), 0, maximum)
+        for frame in range(case.frames)
+    ]).astype(np.uint16 if case.bits == 16 else np.uint8)
+
+    dataset = pydicom.Dataset()
+    dataset.file_meta = FileMetaDataset()
+    dataset.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    dataset.file_meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.7'
+    dataset.file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    dataset.SOPClassUID = dataset.file_meta.MediaStorageSOPClassUID
+    dataset.SOPInstanceUID = dataset.file_meta.MediaStorageSOPInstanceUID
+    dataset.Modality = 'OT'
+    dataset.Rows = dataset.Columns = case.size
+    dataset.PixelSpacing = [0.5, 0.5]
+    dataset.SamplesPerPixel = 1
+    dataset.PhotometricInterpretation = 'MONOCHROME2'
+    dataset.BitsAllocated = case.bits
+    dataset.BitsStored = 12 if case.bits == 16 else 8
+    dataset.HighBit = dataset.BitsStored - 1
+    dataset.PixelRepresentation = 0
+    dataset.WindowCenter = maximum // 2
+    dataset.WindowWidth = maximum
+    if case.frames > 1:
+        dataset.NumberOfFrames = case.frames
+    dataset.PixelData = pixels.tobytes()
+
+    if case.syntax == 'jpeg':
+        frames = []
+        for frame in pixels:
+            buffer = io.BytesIO()
+            Image.fromarray(frame).save(buffer, format='JPEG', quality=90)
+            frames.append(buffer.getvalue())
+        dataset.PixelData = encapsulate(frames)
+        dataset['PixelData'].VR = 'OB'
+        dataset.file_meta.TransferSyntaxUID = JPEGBaseline8Bit
+    elif case.syntax == 'rle':
+        dataset.compress(RLELossless)
+    else:
+        dataset.file_meta.TransferSyntaxUID = SYNTAXES[case.syntax]
+    return Parser.write(dataset)
+
+
+def compress(data: bytes, compression: str) -> str:
+    """
+    Prepare the /convert payload: the DICOM is base64 encoded and then compressed.
+
+    :param data: bytes of the DICOM file.
+    :param compression: name of the compression method.
+    :return: compressed payload as sent in the image field.
+    """
+    encoded = base64.b64encode(data)
+    if compression == 'lz':
+        return LZString.compressToBase64(encoded.decode())
+    if compression == 'none':
+        return encoded.decode()
+    return base64.b64encode(CODECS[compression](encoded)).decode()
+
+
+def load(case: Case, compression: str, directory: typing.Optional[str]) -> typing.Tuple[bytes, str]:
+    """
+    Load the DICOM and its payload from the corpus directory, generating the missing ones.
+
+    LZ compression of the large images is slow, so the generated corpus is kept on disk
+    and reused by the following runs.
+
+    :param case: parameters of the image.
+    :param compression: name of the compression method.
+    :param directory: directory of the corpus, nothing is stored when None.
+    :return: bytes of the DICOM file and the compressed payload.
+    """
+    if directory is None:
+        data = generate(case)
+        return data, compress(data, compression)
+    os.makedirs(directory, exist_ok=True)
+    data = _cached(os.path.join(directory, f'{case.name}.dcm'), lambda: generate(case))
+    payload = _cached(
+        os.path.join(directory, f'{case.name}.{compression}.txt'),
+        lambda: compress(data, compression).encode()
+    )
+    return data, payload.decode()
+
+
+def _cached(path: str, create: typing.Callable[[], bytes]) -> bytes:
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+    data = create()
+    with open(f'{path}.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(f'{path}.tmp', path)
+    return data
+
@@ -0,0 +1,334 @@
+"""
+Load-testing harness replaying the request logs against the service.
+
+Requests are read from the JSON lines file, where every line is either the full request
+({"method": "POST", "path": "/convert", "headers": {...}, "json": {...}}) or just the body
+of the /convert request (the object with the "image" field). Other lines are skipped.
+Synthetic /convert requests can be generated from the benchmark corpus instead.
+
+The requests are sent either to the application in-process through ASGI, or over HTTP
+to the running service (e.g. the local uvicorn started with --uvicorn):
+
+    python -m benchmark.load --log requests.jsonl --concurrency 8 --duration 30
+    python -m benchmark.load --synthetic 1024 --uvicorn --rate 20 --requests 500
+
+The report holds throughput, latency percentiles, error rate and RSS of the server.
+"""
+import os
+import sys
+import json
+import math
+import time
+import typing
+import asyncio
+import argparse
+import itertools
+import subprocess
+import collections
+import concurrent.futures
+
+from benchmark import corpus
+
+UVICORN_PORT = 5099
+RSS_SAMPLING_SECONDS = 0.2
+
+
+class LoadRequest(typing.NamedTuple):
+    method: str
+    path: str
+    headers: dict
+    body: bytes
+
+
+def read_log(path: str, token: typing.Optional[str]) -> typing.Tuple[typing.List[LoadRequest], int]:
+    """
+    Read the requests from the JSON lines log.
+
+    :param path: path of the log.
+    :param token: access token added to the requests without the Authorization header.
+    :return: list of the requests and the number of skipped lines.
+    """
+    requests, skipped = [], 0
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                entry = None
+            if not isinstance(entry, dict) or (request := __to_request(entry, token)) is None:
+                skipped += 1
+            else:
+                requests.append(request)
+    return requests, skipped
+
+
+def synthetic(size: int, compression: str, token: typing.Optional[str]) -> typing.List[LoadRequest]:
+    data = corpus.generate(corpus.Case(size, 16, 1, 'explicit'))
+    request = {'image': corpus.compress(data, compression), 'compression': compression, 'encoded': True}
+    return [__to_request(request, token)]
+
+
+def percentile(values: typing.List[float], fraction: float) -> typing.Optional[float]:
+    # Nearest-rank percentile of the sorted values.
+    if not values:
+        return None
+    return values[min(len(values), max(1, math.ceil(fraction * len(values)))) - 1]
+
+
+async def run(
+        send: typing.Callable[[LoadRequest], typing.Awaitable[int]],
+        requests: typing.List[LoadRequest],
+        concurrency: int,
+        rate: typing.Optional[float],
+        duration: typing.Optional[float],
+        total: typing.Optional[int]
+) -> dict:
+    """
+    Send the requests in a loop until the duration elapses or the total number of them is sent.
+
+    With the rate, request i is not sent before i / rate seconds since the start (open loop),
+    otherwise every worker sends the next request as soon as the previous one finished.
+    """
+    latencies, statuses = [], collections.Counter()
+    counter = iter(range(total)) if total is not None else itertools.count()
+    start = time.perf_counter()
+
+    async def worker():
+        for index in counter:
+            if rate is not None and (delay := start + index / rate - time.perf_counter()) > 0:
+                await asyncio.sleep(delay)
+            if duration is not None and time.perf_counter() - start >= duration:
+                return
+            sent = time.perf_counter()
+            try:
+                status = await send(requests[index % len(requests)])
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - sent)
+            statuses[status] += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not (isinstance(status, int) and status < 400))
+    return {
+        'requests': len(latencies),
+        'seconds': elapsed,
+        'throughput_per_second': len(latencies) / elapsed if elapsed else None,
+        'latency_seconds': {
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'max': latencies[-1] if latencies else None
+        },
+        'error_rate': errors / len(latencies) if latencies else None,
+        'statuses': {str(status): count for status, count in statuses.items()}
+    }
+
+
+def asgi_sender(app) -> typing.Callable[[LoadRequest], typing.Awaitable[int]]:
+    """
+    Create the function sending the request directly to the ASGI application.
+    """
+    async def send(request: LoadRequest) -> int:
+        path, _, query = request.path.partition('?')
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': request.method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query.encode(),
+            'root_path': '',
+            'headers': [(name.lower().encode(), str(value).encode()) for name, value in request.headers.items()],
+            'client': ('127.0.0.1', 0),
+            'server': ('127.0.0.1', 80)
+        }
+        response = {}
+        received = False
+
+        async def receive():
+            nonlocal received
+            if received:
+                # The response is being streamed, the client never disconnects on its own.
+                await asyncio.Event().wait()
+            received = True
+            return {'type': 'http.request', 'body': request.body, 'more_body': False}
+
+        async def transmit(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+
+        await app(scope, receive, transmit)
+        return response['status']
+
+    return send
+
+
+def http_sender(url: str, concurrency: int) -> typing.Callable[[LoadRequest], typing.Awaitable[int]]:
+    """
+    Create the function sending the request over HTTP, blocking calls run in the thread pool.
+    """
+    import requests as http
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+    session = http.Session()
+    adapter = http.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+
+    def post(request: LoadRequest) -> int:
+        resp = session.request(request.method, url + request.path, headers=request.headers, data=request.body)
+        return resp.status_code
+
+    async def send(request: LoadRequest) -> int:
+        return await asyncio.get_running_loop().run_in_executor(pool, post, request)
+
+    return send
+
+
+class RSSMonitor:
+    """
+    Class sampling the resident set size of the server process while the load runs.
+    """
+    def __init__(self, pid: typing.Optional[int]):
+        self.pid = pid
+        self.peak = None
+        self.last = None
+
+    async def sample(self):
+        while self.pid is not None:
+            if (rss := RSSMonitor.read(self.pid)) is not None:
+                self.last = rss
+                self.peak = max(self.peak or 0, rss)
+            await asyncio.sleep(RSS_SAMPLING_SECONDS)
+
+    def report(self) -> dict:
+        return {'pid': self.pid, 'peak_bytes': self.peak, 'last_bytes': self.last}
+
+    @staticmethod
+    def read(pid: int) -> typing.Optional[int]:
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            return None
+        return None
+
+
+async def load(args: argparse.Namespace, requests: typing.List[LoadRequest]) -> dict:
+    server = None
+    if args.uvicorn:
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(args.port), '--log-level', 'warning']
+        )
+        url, pid = f'http://127.0.0.1:{args.port}', server.pid
+        await __wait_until_ready(url)
+    elif args.url is not None:
+        url, pid = args.url.rstrip('/'), args.pid
+    else:
+        url, pid = None, os.getpid()
+    try:
+        if url is None:
+            import main as service
+            from caching.cache import ResultCache
+            if args.no_cache:
+                service.cache = ResultCache(budget=0)
+            send = asgi_sender(service.app)
+        else:
+            send = http_sender(url, args.concurrency)
+        monitor = RSSMonitor(pid)
+        sampling = asyncio.ensure_future(monitor.sample())
+        try:
+            report = await run(send, requests, args.concurrency, args.rate, args.duration, args.requests)
+        finally:
+            sampling.cancel()
+        # The final sample is taken after the load, so short runs report RSS as well.
+        if pid is not None and (rss := RSSMonitor.read(pid)) is not None:
+            monitor.last, monitor.peak = rss, max(monitor.peak or 0, rss)
+        report['target'] = url or 'asgi'
+        report['server_rss'] = monitor.report()
+        return report
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+def main(argv: typing.List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Replay the requests against the service.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--log', help='JSON lines file of the requests to replay')
+    source.add_argument('--synthetic', type=int, help='size of the synthetic image sent in /convert requests')
+    parser.add_argument('--compression', default='lz', help='compression method of the synthetic requests')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', help='URL of the running service, in-process ASGI by default')
+    target.add_argument('--uvicorn', action='store_true', help='start the local uvicorn serving the service')
+    parser.add_argument('--port', type=int, default=UVICORN_PORT, help='port of the started uvicorn')
+    parser.add_argument('--pid', type=int, help='PID of the service behind --url, for the RSS report')
+    parser.add_argument('--token', default=os.getenv('ACCESS_TOKEN'), help='access token of the requests')
+    parser.add_argument('--concurrency', type=int, default=4, help='number of requests sent at once')
+    parser.add_argument('--rate', type=float, help='requests per second, as fast as possible by default')
+    parser.add_argument('--duration', type=float, help='seconds to run for')
+    parser.add_argument('--requests', type=int, help='number of requests to send')
+    parser.add_argument('--no-cache', action='store_true', help='disable the result cache of in-process ASGI')
+    parser.add_argument('--output', help='JSON file of the report, standard output by default')
+    args = parser.parse_args(argv)
+    if args.duration is None and args.requests is None:
+        parser.error('either --duration or --requests is required')
+    if args.token is None:
+        parser.error('--token or ACCESS_TOKEN environment variable is required')
+    # The in-process service and the started uvicorn read the token from the environment.
+    os.environ.setdefault('ACCESS_TOKEN', args.token)
+
+    if args.log is not None:
+        requests, skipped = read_log(args.log, args.token)
+    else:
+        requests, skipped = synthetic(args.synthetic, args.compression, args.token), 0
+    if not requests:
+        parser.error(f'no requests to replay ({skipped} lines skipped)')
+    report = asyncio.run(load(args, requests))
+    report['skipped_lines'] = skipped
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+def __to_request(entry: dict, token: typing.Optional[str]) -> typing.Optional[LoadRequest]:
+    if 'image' in entry:
+        entry = {'method': 'POST', 'path': '/convert', 'json': entry}
+    if 'path' not in entry or not ('json' in entry or 'body' in entry or entry.get('method', 'GET') == 'GET'):
+        return None
+    headers = dict(entry.get('headers') or {})
+    if token is not None:
+        headers.setdefault('Authorization', f'Bearer {token}')
+    if 'json' in entry:
+        headers.setdefault('Content-Type', 'application/json')
+        body = json.dumps(entry['json']).encode()
+    else:
+        body = entry.get('body', '').encode()
+    return LoadRequest(entry.get('method', 'POST' if body else 'GET'), entry['path'], headers, body)
+
+
+async def __wait_until_ready(url: str, timeout: float = 30):
+    import requests as http
+    deadline = time.monotonic() + timeout
+    # Service accepts the connections during the warm-up, it is ready only when /ready returns 200.
+    while time.monotonic() < deadline:
+        try:
+            resp = await asyncio.get_running_loop().run_in_executor(None, http.get, f'{url}/ready')
+            if resp.status_code == 200:
+                return
+        except http.ConnectionError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f'Service at {url} was not ready within {timeout} seconds')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""
+Stage-level benchmark of the conversion pipeline on the synthetic DICOM corpus.
+
+Every stage is measured separately: the LZ decoder, the decompression with base64 decoding,
+DICOM parsing, the conversion, reading of the attributes and the whole /convert endpoint.
+The results are written as JSON, so the runs of different commits can be compared:
+
+    python -m benchmark.stages --sizes 256,1024 --output before.json
+    python -m benchmark.stages --sizes 256,1024 --output after.json --baseline before.json
+"""
+import os
+import sys
+import json
+import time
+import typing
+import argparse
+import platform
+import statistics
+import subprocess
+import tracemalloc
+
+from attributes.reader import AttributesReader
+from benchmark import corpus
+from compression.decompressor import Decompressor
+from compression.methods.lzw import LZWDecompress
+from conversion.converter import Converter
+from parsing.parser import Parser
+
+BENCHMARK_ACCESS_TOKEN = 'benchmark'
+
+
+class Benchmark(typing.NamedTuple):
+    """
+    Single measured stage: setup prepares the arguments of the function and is not measured.
+    """
+    name: str
+    case: corpus.Case
+    compression: typing.Optional[str]
+    input_size: int
+    setup: typing.Callable[[], tuple]
+    function: typing.Callable
+
+
+def benchmarks(
+        cases: typing.List[corpus.Case],
+        compressions: typing.List[str],
+        directory: typing.Optional[str],
+        endpoint: bool = True
+) -> typing.Iterator[Benchmark]:
+    client = __client() if endpoint else None
+    for case in cases:
+        data = None
+        for compression in compressions:
+            data, payload = corpus.load(case, compression, directory)
+            if compression == 'lz':
+                yield Benchmark(
+                    'lz_decompress', case, compression, len(payload), lambda p=payload: (p,), LZWDecompress.decompress
+                )
+            yield Benchmark(
+                'decompress', case, compression, len(payload),
+                lambda p=payload, c=compression: (p, c, True), Decompressor.decompress
+            )
+            if client is not None:
+                request = {'image': payload, 'compression': compression, 'encoded': True}
+                yield Benchmark('endpoint', case, compression, len(payload), lambda r=request: (client, r), __post)
+        # The dataset caches the decoded pixels, so every measurement gets the freshly parsed one.
+        yield Benchmark('parse', case, None, len(data), lambda d=data: (d,), Parser.parse)
+        yield Benchmark('convert', case, None, len(data), lambda d=data: (Parser.parse(d),), Converter.convert)
+        yield Benchmark(
+            'read_attributes', case, None, len(data),
+            lambda d=data: (Parser.parse(d),), AttributesReader.read_attributes
+        )
+
+
+def measure(benchmark: Benchmark, repeat: int) -> dict:
+    """
+    Measure the benchmark: the durations of repeat runs and the peak memory of one additional run.
+
+    The peak memory is the peak of the memory traced by tracemalloc (Python objects and numpy
+    arrays), measured separately since the tracing slows the measured function down.
+    """
+    durations = []
+    for _ in range(repeat):
+        args = benchmark.setup()
+        start = time.perf_counter()
+        benchmark.function(*args)
+        durations.append(time.perf_counter() - start)
+    args = benchmark.setup()
+    tracemalloc.start()
+    try:
+        benchmark.function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    median = statistics.median(durations)
+    return {
+        'benchmark': benchmark.name,
+        'case': benchmark.case.name,
+        'compression': benchmark.compression,
+        'input_bytes': benchmark.input_size,
+        'repeat': repeat,
+        'min_seconds': min(durations),
+        'median_seconds': median,
+        'throughput_mb_per_second': benchmark.input_size / median / 1e6 if median else None,
+        'peak_memory_bytes': peak
+    }
+
+
+def compare(results: typing.List[dict], baseline: typing.List[dict], tolerance: float) -> typing.List[dict]:
+    """
+    Compare the median durations with the baseline run.
+
+    :return: comparisons of the benchmarks present in both runs, regressions are flagged.
+    """
+    previous = {(r['benchmark'], r['case'], r['compression']): r for r in baseline}
+    comparisons = []
+    for result in results:
+        if (base := previous.get((result['benchmark'], result['case'], result['compression']))) is None:
+            continue
+        ratio = result['median_seconds'] / base['median_seconds'] if base['median_seconds'] else None
+        memory_ratio = result['peak_memory_bytes'] / base['peak_memory_bytes'] if base['peak_memory_bytes'] else None
+        comparisons.append({
+            'benchmark': result['benchmark'],
+            'case': result['case'],
+            'compression': result['compression'],
+            'time_ratio': ratio,
+            'memory_ratio': memory_ratio,
+            'regression': ratio is not None and ratio > 1 + tolerance
+        })
+    return comparisons
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.time()
+    }
+
+
+def main(argv: typing.List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the conversion pipeline stages.')
+    parser.add_argument('--sizes', default='256,1024,4096', help='comma separated image sizes')
+    parser.add_argument('--bits', default='8,16', help='comma separated bits allocated')
+    parser.add_argument('--frames', default='1', help='comma separated numbers of frames')
+    parser.add_argument('--syntaxes', default='explicit', help=f'comma separated of: {", ".join(corpus.SYNTAXES)}')
+    parser.add_argument('--compressions', default=','.join(corpus.COMPRESSIONS), help='comma separated methods')
+    parser.add_argument('--repeat', type=int, default=3, help='number of measured runs')
+    parser.add_argument('--corpus', default='.benchmark-corpus', help='directory of the generated corpus')
+    parser.add_argument('--no-endpoint', action='store_true', help='skip the /convert endpoint benchmark')
+    parser.add_argument('--output', help='JSON file of the results, standard output by default')
+    parser.add_argument('--baseline', help='JSON file of the previous results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative slowdown')
+    args = parser.parse_args(argv)
+
+    cases = corpus.cases(
+        [int(size) for size in args.sizes.split(',')],
+        [int(bits) for bits in args.bits.split(',')],
+        [int(frames) for frames in args.frames.split(',')],
+        args.syntaxes.split(',')
+    )
+    results = []
+    for benchmark in benchmarks(cases, args.compressions.split(','), args.corpus, not args.no_endpoint):
+        results.append(measure(benchmark, args.repeat))
+        print(
+            f'{benchmark.name:>16} {benchmark.case.name:>28} {benchmark.compression or "-":>5} '
+            f'{results[-1]["median_seconds"]:10.4f}s {results[-1]["peak_memory_bytes"] / 1e6:10.1f}MB',
+            file=sys.stderr
+        )
+    report = {'environment': environment(), 'results': results}
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            report['comparison'] = compare(results, json.load(f)['results'], args.tolerance)
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 1 if any(c['regression'] for c in report.get('comparison', ())) else 0
+
+
+def __client():
+    # The service is imported only when the endpoint is measured, with the cache disabled.
+    os.environ.setdefault('ACCESS_TOKEN', BENCHMARK_ACCESS_TOKEN)
+    from fastapi.testclient import TestClient
+    from caching.cache import ResultCache
+    import main as service
+    service.cache = ResultCache(budget=0)
+    return TestClient(service.app)
+
+
+def __post(client, request: dict):
+    resp = client.post('/convert', json=request, headers={'Authorization': f'Bearer {os.environ["ACCESS_TOKEN"]}'})
+    if resp.status_code != 200:
+        raise RuntimeError(f'Endpoint returned {resp.status_code}: {resp.text}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
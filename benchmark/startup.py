@@ -0,0 +1,123 @@
+"""
+Startup profile of the service: import time and the latency of the first requests.
+
+Every measurement runs in a fresh interpreter, so nothing is imported or cached beforehand:
+
+    python -m benchmark.startup --output startup.json
+
+The report holds the import time of the service with the slowest modules (python -X importtime),
+the heavy modules loaded by the import, and the latency of the first two /convert requests
+with and without the warm-up.
+"""
+import os
+import sys
+import json
+import time
+import typing
+import asyncio
+import argparse
+import subprocess
+
+HEAVY_MODULES = ('numpy', 'pydicom', 'PIL')
+STARTUP_ACCESS_TOKEN = 'startup'
+
+
+def import_profile(top: int) -> dict:
+    """
+    Import the service with -X importtime and collect the cumulative import times.
+
+    :param top: number of the slowest modules to report.
+    :return: total import time and the slowest modules (by their own import time) in seconds.
+    """
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(own) / 1e6, int(cumulative) / 1e6))
+    total = next((cumulative for name, _, cumulative in modules if name == 'main'), None)
+    slowest = sorted(modules, key=lambda module: module[1], reverse=True)[:top]
+    return {
+        'seconds': total,
+        'slowest_modules': [
+            {'module': name, 'seconds': own, 'cumulative_seconds': cumulative} for name, own, cumulative in slowest
+        ]
+    }
+
+
+def cold_start(warm_up: bool) -> dict:
+    """
+    Measure the cold start of the service in the fresh interpreter.
+    """
+    from benchmark import load
+    # The request is prepared here, since preparing it imports the heavy modules.
+    request = load.synthetic(64, 'lz', STARTUP_ACCESS_TOKEN)[0]
+    process = subprocess.run(
+        [sys.executable, '-m', 'benchmark.startup', '--child'] + (['--warm-up'] if warm_up else []),
+        input=json.dumps({'path': request.path, 'headers': request.headers, 'body': request.body.decode()}),
+        capture_output=True, text=True, check=True,
+        env={**os.environ, 'WARM_UP': '0', 'ACCESS_TOKEN': STARTUP_ACCESS_TOKEN}
+    )
+    return json.loads(process.stdout)
+
+
+def child(warm_up: bool) -> dict:
+    entry = json.load(sys.stdin)
+    start = time.perf_counter()
+    import main as service
+    imported = time.perf_counter() - start
+    heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+    from benchmark import load
+    request = load.LoadRequest('POST', entry['path'], entry['headers'], entry['body'].encode())
+    send = load.asgi_sender(service.app)
+    warm_up_seconds = None
+    if warm_up:
+        # The same warm-up the service runs at startup with the inline executor.
+        start = time.perf_counter()
+        from pipeline import pipeline
+        pipeline.warm_up()
+        warm_up_seconds = time.perf_counter() - start
+    latencies, statuses = [], []
+    for _ in range(2):
+        start = time.perf_counter()
+        statuses.append(asyncio.run(send(request)))
+        latencies.append(time.perf_counter() - start)
+    return {
+        'import_seconds': imported,
+        'heavy_modules_after_import': heavy,
+        'warm_up_seconds': warm_up_seconds,
+        'first_request_seconds': latencies[0],
+        'second_request_seconds': latencies[1],
+        'statuses': statuses
+    }
+
+
+def main(argv: typing.List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Profile the startup of the service.')
+    parser.add_argument('--top', type=int, default=15, help='number of the slowest modules to report')
+    parser.add_argument('--output', help='JSON file of the report, standard output by default')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--warm-up', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        json.dump(child(args.warm_up), sys.stdout)
+        return 0
+    report = {
+        'import': import_profile(args.top),
+        'cold_start': cold_start(warm_up=False),
+        'warm_start': cold_start(warm_up=True)
+    }
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+import os
+import json
+import typing
+import asyncio
+import hashlib
+import logging
+import threading
+
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    Class implementing content-addressed LRU cache of the conversion results.
+
+    Results are keyed by the hash of the request content, so the same study submitted
+    again is served without running the conversion pipeline. The cache is bounded
+    by the total size of stored results in bytes, the least recently used results
+    are evicted first.
+
+    Optionally the results are also stored in the directory, so they survive
+    the restart of the service. The on-disk tier is bounded by directory_budget bytes,
+    the files are evicted in the order of their modification time, which is refreshed
+    when the file is read (LRU). Files are read and written outside the event loop.
+    """
+    def __init__(self, budget: int, directory: str = None, directory_budget: int = 1 << 30):
+        self.budget = budget
+        self.directory = directory
+        self.directory_budget = directory_budget
+        self.size = 0
+        self.directory_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__files = OrderedDict()
+        self.__files_lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self.__scan()
+
+    @staticmethod
+    def key(*parts) -> str:
+        """
+        Compute the content address of the request.
+
+        :param parts: request fields determining the conversion result.
+        :return: hex digest identifying the result.
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        for part in parts:
+            part = part if isinstance(part, bytes) else str(part).encode()
+            # Length prefix keeps the boundaries between parts unambiguous.
+            digest.update(len(part).to_bytes(8, 'little'))
+            digest.update(part)
+        return digest.hexdigest()
+
+    async def get(self, key: str) -> typing.Optional[dict]:
+        if (result := self.__entries.get(key)) is not None:
+            self.__entries.move_to_end(key)
+        elif self.directory is not None and (result := await asyncio.to_thread(self.__load, key)) is not None:
+            self.__store(key, result)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    async def put(self, key: str, result: dict):
+        # Multi-frame results may be arbitrarily large, so they are never cached.
+        if 'frames' in result:
+            return
+        if self.__store(key, result) and self.directory is not None:
+            await asyncio.to_thread(self.__save, key, result)
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self.__entries),
+            'size': self.size,
+            'budget': self.budget,
+            'files': len(self.__files),
+            'directory_size': self.directory_size
+        }
+
+    def __store(self, key: str, result: dict) -> bool:
+        size = ResultCache.__size_of(result)
+        if size > self.budget:
+            return False
+        if key in self.__entries:
+            self.size -= ResultCache.__size_of(self.__entries.pop(key))
+        self.__entries[key] = result
+        self.size += size
+        while self.size > self.budget:
+            _, evicted = self.__entries.popitem(last=False)
+            self.size -= ResultCache.__size_of(evicted)
+        return True
+
+    def __scan(self):
+        # Files left by the previous run are evicted first in the order of their modification time.
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, key, size in sorted(files):
+            self.__files[key] = size
+            self.directory_size += size
+        self.__evict_files()
+
+    def __load(self, key: str) -> typing.Optional[dict]:
+        path = os.path.join(self.directory, key)
+        try:
+            # The file holds the JSON line with everything but the photo, followed by the photo bytes.
+            with open(path, 'rb') as f:
+                result = json.loads(f.readline())
+                if result.pop('has_photo'):
+                    result['photo'] = f.read()
+            # Modification time orders the files for the eviction, also after the restart.
+            os.utime(path)
+            with self.__files_lock:
+                if key in self.__files:
+                    self.__files.move_to_end(key)
+            return result
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.error(f'Cache load error: {e}')
+            return None
+
+    def __save(self, key: str, result: dict):
+        path = os.path.join(self.directory, key)
+        try:
+            # Write to the temporary file first, so readers never see a partial result.
+            with open(f'{path}.tmp', 'wb') as f:
+                header = {name: value for name, value in result.items() if name != 'photo'}
+                f.write(json.dumps({**header, 'has_photo': 'photo' in result}).encode() + b'\n')
+                f.write(result.get('photo', b''))
+            os.replace(f'{path}.tmp', path)
+            size = os.path.getsize(path)
+            with self.__files_lock:
+                self.directory_size += size - self.__files.pop(key, 0)
+                self.__files[key] = size
+                self.__evict_files()
+        except Exception as e:
+            logging.error(f'Cache save error: {e}')
+
+    def __evict_files(self):
+        while self.directory_size > self.directory_budget and self.__files:
+            key, size = self.__files.popitem(last=False)
+            self.directory_size -= size
+            try:
+                os.remove(os.path.join(self.directory, key))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logging.error(f'Cache eviction error: {e}')
+
+    @staticmethod
+    def __size_of(result: dict) -> int:
+        return len(result.get('photo', b'')) + len(json.dumps(result['attributes']))
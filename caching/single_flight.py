@@ -0,0 +1,36 @@
+import asyncio
+import typing
+
+
+class SingleFlight:
+    """
+    Class coalescing the concurrent computations of the same result.
+
+    The first caller with the given key (the leader) starts the computation,
+    the callers arriving before it finishes wait for the same computation and
+    share its result or its error. The computation runs as a separate task,
+    so the cancellation of any caller (including the leader) does not affect
+    the remaining ones.
+    """
+    def __init__(self):
+        self.coalesced = 0
+        self.__calls = {}
+
+    def __len__(self) -> int:
+        return len(self.__calls)
+
+    async def run(self, key: str, fn: typing.Callable[[], typing.Awaitable]) -> typing.Any:
+        """
+        Run the computation unless the one with the same key is already in flight.
+
+        :param key: key identifying the result of the computation.
+        :param fn: function creating the awaitable computing the result.
+        :return: result of the computation.
+        """
+        if (task := self.__calls.get(key)) is None:
+            task = asyncio.ensure_future(fn())
+            self.__calls[key] = task
+            task.add_done_callback(lambda _: self.__calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
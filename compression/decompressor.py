@@ -1,8 +1,22 @@
-import base64
+import typing
+import binascii
 
+from compression.methods.codecs import ZlibDecompress, GzipDecompress, LZMADecompress, BZ2Decompress
 from compression.methods.lzw import LZWDecompress
 from compression.methods.no_operation import NoCompression
 
+# Bytes which are not part of the base64 alphabet, they are discarded like by base64.b64decode.
+_NON_BASE64_BYTES = bytes(
+    set(range(256)) - set(b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=')
+)
+
+
+class OutputLimitError(Exception):
+    """
+    Error raised when the decompressed data exceeds the allowed size.
+    """
+    pass
+
 
 class Decompressor:
     """
@@ -15,21 +29,123 @@ class Decompressor:
     Decompressor performs also base64 decoding if the submitted data was originally
     encoded in base64 (DICOM data encoded in base64 before compression).
 
+    Decompression is performed in a streaming fashion: chunks produced by the decompression
+    method are decoded as soon as they arrive, so the full decompressed string is never built.
+    The total size of the decompressed data is limited by max_output_size.
+
     IMPORTANT:  Data after compression must be encoded in base64 and decompression methods
                 should take this into account.
     """
+    max_output_size = 1 << 30
     allowed_compression_methods = {
         'none': NoCompression,
-        'lz': LZWDecompress
+        'lz': LZWDecompress,
+        'zlib': ZlibDecompress,
+        'gzip': GzipDecompress,
+        'lzma': LZMADecompress,
+        'bz2': BZ2Decompress
     }
+    allowed_content_encodings = {
+        'identity': NoCompression,
+        'gzip': GzipDecompress,
+        'deflate': ZlibDecompress
+    }
+
+    @staticmethod
+    def decompress(compressed: str, method: str, is_encoded: bool = True) -> bytearray:
+        return Decompressor.__collect(Decompressor.decompress_stream(compressed, method, is_encoded))
 
     @staticmethod
-    def decompress(compressed: str, method: str, is_encoded: bool = True):
+    def decompress_stream(compressed: str, method: str, is_encoded: bool = True) -> typing.Iterator[bytes]:
         if (decompress_method := Decompressor.allowed_compression_methods.get(method)) is None:
             raise NotImplementedError
         # Decompress the data accordingly to allowed compression method.
-        decompressed_data = decompress_method.decompress(compressed)
+        chunks = decompress_method.decompress_stream(compressed)
         # Perform optional final base64 decoding.
-        return decompressed_data.encode() \
-            if not is_encoded \
-            else base64.b64decode(decompressed_data)
+        return Decompressor.__decode_stream(chunks) \
+            if is_encoded \
+            else (chunk.encode() if isinstance(chunk, str) else chunk for chunk in chunks)
+
+    @staticmethod
+    def decompress_until(compressed: str, method: str, is_encoded: bool, marker: bytes) -> bytearray:
+        """
+        Decompress the data only up to the marker, e.g. in order to skip the DICOM pixel data.
+
+        :param compressed: compressed data.
+        :param method: name of the compression method.
+        :param is_encoded: whether the decompressed data is base64 encoded.
+        :param marker: bytes after which the decompression stops.
+        :return: decompressed data containing the marker, or the whole data when there is no marker.
+        """
+        decompressed = bytearray()
+        for chunk in Decompressor.decompress_stream(compressed, method, is_encoded):
+            # The marker may span the chunks, so the search starts within the previous chunk.
+            start = max(0, len(decompressed) - len(marker) + 1)
+            decompressed += chunk
+            if len(decompressed) > Decompressor.max_output_size:
+                raise OutputLimitError(f'Decompressed data exceeds {Decompressor.max_output_size} bytes')
+            if decompressed.find(marker, start) >= 0:
+                break
+        return decompressed
+
+    @staticmethod
+    def peek(compressed: typing.Union[str, bytes], method: str, is_encoded: bool, size: int) -> bytes:
+        """
+        Decompress only the beginning of the data, e.g. in order to read the DICOM header.
+
+        :param compressed: compressed data.
+        :param method: name of the compression method or of the content encoding for bytes.
+        :param is_encoded: whether the decompressed data is base64 encoded.
+        :param size: minimal number of the decompressed bytes to return.
+        :return: at least size first decompressed bytes, unless the data is shorter.
+        """
+        if isinstance(compressed, bytes):
+            if (decode_method := Decompressor.allowed_content_encodings.get(method.strip().lower())) is None:
+                raise NotImplementedError
+            chunks = decode_method.decompress_stream(compressed)
+        else:
+            chunks = Decompressor.decompress_stream(compressed, method, is_encoded)
+        head = bytearray()
+        for chunk in chunks:
+            head += chunk
+            if len(head) >= size:
+                break
+        return bytes(head)
+
+    @staticmethod
+    def decode_content(data: bytes, encoding: str) -> bytes:
+        """
+        Decode the binary data compressed with the HTTP content encoding.
+
+        :param data: bytes submitted in the request body.
+        :param encoding: value of the Content-Encoding header.
+        :return: decoded bytes.
+        """
+        if (decode_method := Decompressor.allowed_content_encodings.get(encoding.strip().lower())) is None:
+            raise NotImplementedError
+        if decode_method is NoCompression:
+            return data
+        return Decompressor.__collect(decode_method.decompress_stream(data))
+
+    @staticmethod
+    def __collect(chunks: typing.Iterable[bytes]) -> bytearray:
+        decompressed = bytearray()
+        for chunk in chunks:
+            decompressed += chunk
+            if len(decompressed) > Decompressor.max_output_size:
+                raise OutputLimitError(f'Decompressed data exceeds {Decompressor.max_output_size} bytes')
+        return decompressed
+
+    @staticmethod
+    def __decode_stream(chunks: typing.Iterable[typing.Union[str, bytes]]) -> typing.Iterator[bytes]:
+        pending = b''
+        for chunk in chunks:
+            chunk = chunk.encode('ascii') if isinstance(chunk, str) else chunk
+            pending += chunk.translate(None, _NON_BASE64_BYTES)
+            # Only full 4 character groups can be decoded independently.
+            ready = len(pending) - len(pending) % 4
+            if ready:
+                yield binascii.a2b_base64(pending[:ready])
+                pending = pending[ready:]
+        if pending:
+            yield binascii.a2b_base64(pending)
@@ -1,17 +1,32 @@
+import typing
 from abc import ABC, abstractmethod
 
 
 class Method(ABC):
     @staticmethod
     @abstractmethod
-    def decompress(compressed: str) -> str:
+    def decompress(compressed: typing.Union[str, bytes]) -> typing.Union[str, bytes]:
         """
-        Abstract method allowing to decompress the string.
+        Abstract method allowing to decompress the string or bytes.
 
         It is the base method for all the implementations
-        of decompression algorithms.
+        of decompression algorithms. Text based methods (like LZ)
+        produce strings, binary codecs produce bytes.
 
-        :param compressed: string containing compressed data.
-        :return: string being the result of decompression.
+        :param compressed: string or bytes containing compressed data.
+        :return: string or bytes being the result of decompression.
         """
         pass
+
+    @classmethod
+    def decompress_stream(cls, compressed: typing.Union[str, bytes]) -> typing.Iterator[typing.Union[str, bytes]]:
+        """
+        Method allowing to decompress the string or bytes in chunks.
+
+        Implementations able to produce the result incrementally should override it,
+        the default one yields the whole result of decompress as a single chunk.
+
+        :param compressed: string or bytes containing compressed data.
+        :return: iterator over consecutive chunks of the decompressed data.
+        """
+        yield cls.decompress(compressed)
@@ -0,0 +1,79 @@
+import bz2
+import lzma
+import zlib
+import typing
+import binascii
+
+from compression.method import Method
+
+
+class CodecDecompress(Method):
+    """
+    Base class of the decompression methods backed by the standard library codecs.
+
+    Codecs operate on bytes: the string input is treated as base64 encoded compressed
+    bytes (the way binary data is carried in JSON), while the bytes input is decompressed
+    directly. The output is produced incrementally in chunks of bounded size, so even
+    highly compressed input never expands in memory at once.
+    """
+    chunk_size = 1 << 20
+
+    @staticmethod
+    def create():
+        """
+        Create the incremental decompressor object of the codec.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def decompress(cls, compressed: typing.Union[str, bytes]) -> bytes:
+        return b''.join(cls.decompress_stream(compressed))
+
+    @classmethod
+    def decompress_stream(cls, compressed: typing.Union[str, bytes]) -> typing.Iterator[bytes]:
+        data = binascii.a2b_base64(compressed) if isinstance(compressed, str) else compressed
+        decompressor = cls.create()
+        while True:
+            chunk = decompressor.decompress(data, cls.chunk_size)
+            if chunk:
+                yield chunk
+            if decompressor.eof:
+                return
+            data = cls.remaining(decompressor)
+            if not chunk and not data:
+                raise ValueError('Compressed data is truncated')
+
+    @staticmethod
+    def remaining(decompressor) -> bytes:
+        """
+        Return the input which was not consumed by the last decompress call.
+        """
+        return b''
+
+
+class ZlibDecompress(CodecDecompress):
+    wbits = zlib.MAX_WBITS
+
+    @classmethod
+    def create(cls):
+        return zlib.decompressobj(cls.wbits)
+
+    @staticmethod
+    def remaining(decompressor) -> bytes:
+        return decompressor.unconsumed_tail
+
+
+class GzipDecompress(ZlibDecompress):
+    wbits = 16 + zlib.MAX_WBITS
+
+
+class LZMADecompress(CodecDecompress):
+    @staticmethod
+    def create():
+        return lzma.LZMADecompressor()
+
+
+class BZ2Decompress(CodecDecompress):
+    @staticmethod
+    def create():
+        return bz2.BZ2Decompressor()
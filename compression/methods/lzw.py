@@ -1,20 +1,35 @@
+import typing
+
 from compression.method import Method
 
 
 class LZWDecompress(Method):
     @staticmethod
-    def decompress(compressed: str) -> str:
+    def decompress(compressed: typing.Union[str, bytes]) -> str:
         """
         Implementation of the LZW decompression algorithm.
 
         :param compressed: string of compressed bytes.
         :return: string containing the uncompressed bytes.
         """
-        decompressed = LZString.decompressFromBase64(compressed)
+        return "".join(LZWDecompress.decompress_stream(compressed))
+
+    @staticmethod
+    def decompress_stream(compressed: typing.Union[str, bytes]) -> typing.Iterator[str]:
+        """
+        Implementation of the LZW decompression algorithm yielding the result in chunks.
+
+        :param compressed: string of compressed bytes.
+        :return: iterator over consecutive chunks of the uncompressed bytes.
+        """
+        decompressed = False
+        compressed = compressed.decode('ascii') if isinstance(compressed, bytes) else compressed
+        for chunk in decompressStreamFromBase64(compressed):
+            decompressed = decompressed or bool(chunk)
+            yield chunk
         # The LZ method may not signal error on its own, so we check if we performed the decompression.
         if not decompressed:
             raise Exception('Corrupted compressed data')
-        return decompressed
 
 
 """
@@ -440,3 +455,185 @@ class LZString(object):
             return None
         compressed = compressed.replace(" ", "+")
         return _decompress(len(compressed), 32, lambda index: getBaseValue(keyStrUriSafe, compressed[index]))
+
+
+
+"""
+Table-driven decoder used by LZWDecompress.
+
+It produces exactly the same output as _decompress for the streams created by
+LZString.compressToBase64, but avoids its per-bit overhead:
+    - the input is translated into symbols with a precomputed table,
+    - the symbols are packed into bytes, so the codes are read in bulk
+      from a local integer bit buffer,
+    - the input is translated and packed lazily in blocks of _BLOCK_SYMBOLS symbols,
+      so the memory does not grow with the input and reading only the beginning
+      of the stream (e.g. the DICOM header) processes only the beginning of the input,
+    - the dictionary is kept in a list indexed by code,
+    - the result is yielded in chunks instead of being joined into one string.
+"""
+
+_INVALID_SYMBOL = 0xFF
+_REFILL_BYTES = 7
+_CHUNK_ENTRIES = 4096
+# Multiple of 4, so the packed 6-bit symbols of every block end on a byte boundary.
+_BLOCK_SYMBOLS = 1 << 16
+
+
+def _reverse_bits(value, width):
+    result = 0
+    for _ in range(width):
+        result = (result << 1) | (value & 1)
+        value >>= 1
+    return result
+
+
+def _build_translation_table(alphabet, bitsPerChar):
+    # Characters are read starting from the most significant bit, while the codes
+    # are assembled starting from the least significant one. Storing the symbols
+    # bit-reversed lets the decoder consume the stream with plain shifts.
+    table = bytearray([_INVALID_SYMBOL] * 256)
+    for index, character in enumerate(alphabet):
+        table[ord(character)] = _reverse_bits(index & ((1 << bitsPerChar) - 1), bitsPerChar)
+    return bytes(table)
+
+
+_base64TranslationTable = _build_translation_table(keyStrBase64, 6)
+
+
+def _pack_symbols(symbols, bitsPerChar):
+    # NumPy is imported with the first decompression, so it does not slow down the service start.
+    import numpy as np
+    symbols = np.frombuffer(symbols, dtype=np.uint8)
+    bits = np.unpackbits(symbols[:, None], axis=1, bitorder='little')[:, :bitsPerChar]
+    return np.packbits(bits.ravel(), bitorder='little').tobytes(), symbols.size * bitsPerChar
+
+
+def _packed_blocks(compressed, translationTable, bitsPerChar):
+    for start in range(0, len(compressed), _BLOCK_SYMBOLS):
+        symbols = compressed[start:start + _BLOCK_SYMBOLS].encode('ascii', 'replace').translate(translationTable)
+        # The stream ends at the first invalid character, reading past it is an error.
+        end = symbols.find(_INVALID_SYMBOL)
+        yield _pack_symbols(symbols if end < 0 else symbols[:end], bitsPerChar)
+        if end >= 0:
+            return
+
+
+def _next_block(blocks, packed, packedBits, index):
+    # Unread bytes of the current block are joined with the following ones, the blocks end on a byte boundary.
+    for block, blockBits in blocks:
+        packed, packedBits, index = packed[index:] + block, packedBits - index * 8 + blockBits, 0
+        if len(packed) >= _REFILL_BYTES:
+            break
+    return packed, packedBits, index
+
+
+def _decompress_symbols(blocks, chunkEntries=_CHUNK_ENTRIES):
+    packed = b''
+    packedBits = 0
+    index = 0
+    buffer = 0
+    buffered = 0
+
+    def read_bits(n):
+        nonlocal packed, packedBits, index, buffer, buffered
+        while buffered < n:
+            if index + _REFILL_BYTES > len(packed):
+                packed, packedBits, index = _next_block(blocks, packed, packedBits, index)
+            available = min(_REFILL_BYTES * 8, packedBits - index * 8)
+            if available <= 0:
+                raise ValueError('Unexpected end of compressed data')
+            buffer |= int.from_bytes(packed[index:index + _REFILL_BYTES], 'little') << buffered
+            buffered += available
+            index += _REFILL_BYTES
+        bits = buffer & ((1 << n) - 1)
+        buffer >>= n
+        buffered -= n
+        return bits
+
+    # Codes 0, 1 and 2 are reserved, so they get placeholders in the dictionary.
+    dictionary = [None, None, None]
+    result = []
+    enlargeIn = 4
+    numBits = 3
+    mask = (1 << numBits) - 1
+
+    code = read_bits(2)
+    if code == 0:
+        c = chr(read_bits(8))
+    elif code == 1:
+        c = chr(read_bits(16))
+    else:
+        return
+    dictionary.append(c)
+    dictSize = 4
+    w = c
+    result.append(c)
+    append = result.append
+    extend = dictionary.append
+
+    while True:
+        # Inlined read_bits(numBits), since it is executed for every code.
+        if buffered < numBits:
+            if index + _REFILL_BYTES > len(packed):
+                packed, packedBits, index = _next_block(blocks, packed, packedBits, index)
+            available = min(_REFILL_BYTES * 8, packedBits - index * 8)
+            if available <= 0:
+                raise ValueError('Unexpected end of compressed data')
+            buffer |= int.from_bytes(packed[index:index + _REFILL_BYTES], 'little') << buffered
+            buffered += available
+            index += _REFILL_BYTES
+            if buffered < numBits:
+                raise ValueError('Unexpected end of compressed data')
+        code = buffer & mask
+        buffer >>= numBits
+        buffered -= numBits
+
+        if code < 3:
+            if code == 2:
+                yield "".join(result)
+                return
+            extend(chr(read_bits(8 if code == 0 else 16)))
+            code = dictSize
+            dictSize += 1
+            enlargeIn -= 1
+            if enlargeIn == 0:
+                enlargeIn = 1 << numBits
+                numBits += 1
+                mask = (1 << numBits) - 1
+
+        if code < dictSize:
+            entry = dictionary[code]
+        elif code == dictSize:
+            entry = w + w[0]
+        else:
+            raise ValueError('Corrupted compressed data')
+        append(entry)
+        if len(result) >= chunkEntries:
+            yield "".join(result)
+            result.clear()
+
+        # Add w+entry[0] to the dictionary.
+        extend(w + entry[0])
+        dictSize += 1
+        enlargeIn -= 1
+
+        w = entry
+        if enlargeIn == 0:
+            enlargeIn = 1 << numBits
+            numBits += 1
+            mask = (1 << numBits) - 1
+
+
+def decompressStreamFromBase64(compressed):
+    if not compressed:
+        return iter(())
+    return _decompress_symbols(_packed_blocks(compressed, _base64TranslationTable, 6))
+
+
+def decompressFromBase64(compressed):
+    if compressed is None:
+        return ""
+    if compressed == "":
+        return None
+    return "".join(decompressStreamFromBase64(compressed))
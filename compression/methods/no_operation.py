@@ -1,9 +1,13 @@
+import typing
+
 from compression.method import Method
 
 
 class NoCompression(Method):
+    chunk_size = 1 << 20
+
     @staticmethod
-    def decompress(compressed: str) -> str:
+    def decompress(compressed: typing.Union[str, bytes]) -> typing.Union[str, bytes]:
         """
         Implementation of the no decompression algorithm.
 
@@ -11,3 +15,14 @@ class NoCompression(Method):
         :return: string containing the uncompressed bytes (same as the input).
         """
         return compressed
+
+    @staticmethod
+    def decompress_stream(compressed: typing.Union[str, bytes]) -> typing.Iterator[typing.Union[str, bytes]]:
+        """
+        Implementation of the no decompression algorithm yielding the input in chunks.
+
+        :param compressed: string of compressed bytes.
+        :return: iterator over consecutive slices of the input.
+        """
+        for start in range(0, len(compressed), NoCompression.chunk_size):
+            yield compressed[start:start + NoCompression.chunk_size]
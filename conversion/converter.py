@@ -1,20 +1,108 @@
-import io
 import typing
 import numpy as np
 import pydicom
 from PIL import Image
+from conversion.encoding import Encoder
+from conversion.frames import Frames
+from conversion.resizing import Resizing
+from conversion.windowing import Windowing
 
 
 class Converter:
     @staticmethod
-    def convert(dcm_decompressed_bytes: typing.BinaryIO) -> bytes:
-        im = pydicom.dcmread(dcm_decompressed_bytes, force=True)
-        # Convert type to float and reduce it values into [0, 255] size range.
-        im = im.pixel_array.astype(float)
-        im = (np.maximum(im, 0) / np.amax(im)) * 255
-        im = np.uint8(im)
-        im = Image.fromarray(im)
-        img_byte_arr = io.BytesIO()
-        im.save(img_byte_arr, 'PNG')
-        img_byte_arr = img_byte_arr.getvalue()
-        return img_byte_arr
+    def convert(
+            dataset: pydicom.Dataset,
+            frame: int = 0,
+            max_width: int = None,
+            max_height: int = None,
+            scale: float = None,
+            **options
+    ) -> bytes:
+        size = Resizing.target_size(dataset.Columns, dataset.Rows, max_width, max_height, scale)
+        pixels = Resizing.decode_reduced(dataset, size) if size is not None else None
+        if pixels is None:
+            pixels = next(Frames.iterate(dataset, [frame]))
+        return Converter.__convert_pixels(dataset, pixels, size, **options)
+
+    @staticmethod
+    def convert_frames(
+            dataset: pydicom.Dataset,
+            frames: typing.List[int],
+            max_width: int = None,
+            max_height: int = None,
+            scale: float = None,
+            **options
+    ) -> typing.Iterator[typing.Tuple[int, bytes]]:
+        """
+        Convert the frames of multi-frame DICOM one by one.
+
+        Every frame is decoded only when the previous one was already converted,
+        so only a single decoded frame is kept in memory at once.
+
+        :param dataset: parsed DICOM dataset.
+        :param frames: indices of the frames to convert.
+        :param max_width: maximal width of the output images.
+        :param max_height: maximal height of the output images.
+        :param scale: scale factor of the output images.
+        :param options: options of the windowing and the output encoding.
+        :return: iterator over pairs of the frame index and the encoded image.
+        """
+        size = Resizing.target_size(dataset.Columns, dataset.Rows, max_width, max_height, scale)
+        for index, pixels in zip(frames, Frames.iterate(dataset, frames)):
+            yield index, Converter.__convert_pixels(dataset, pixels, size, **options)
+
+    @staticmethod
+    def __convert_pixels(
+            dataset: pydicom.Dataset,
+            pixels: np.ndarray,
+            size: typing.Optional[typing.Tuple[int, int]],
+            window: str = None,
+            window_center: float = None,
+            window_width: float = None,
+            format: str = 'png',
+            compress_level: int = None,
+            optimize: bool = False,
+            quality: int = None
+    ) -> bytes:
+        # Previews are reduced before any other processing of the pixels.
+        if size is not None:
+            pixels = Resizing.downsample(pixels, size)
+        # Apply the optional VOI window, the pixels are scaled to their maximum by default.
+        im = Windowing.apply(dataset, pixels, window, window_center, window_width) \
+            if window is not None \
+            else None
+        if im is None:
+            im = Converter.to_uint8(pixels)
+        im = Converter.__to_image(im)
+        if size is not None and im.size != size:
+            im = im.resize(size, Image.BILINEAR)
+        return Encoder.encode(im, format, compress_level, optimize, quality)
+
+    @staticmethod
+    def __to_image(pixels: np.ndarray) -> Image.Image:
+        # Greyscale image shares the memory of the uint8 array, Pillow stores RGB as RGBX, so it copies anyway.
+        if pixels.ndim == 2 and pixels.flags.c_contiguous:
+            return Image.frombuffer('L', (pixels.shape[1], pixels.shape[0]), pixels, 'raw', 'L', 0, 1)
+        return Image.fromarray(pixels)
+
+    @staticmethod
+    def to_uint8(pixels: np.ndarray) -> np.ndarray:
+        """
+        Scale the pixels into [0, 255] range, negative values are clipped to 0.
+
+        Integer pixels up to 16 bits are mapped in a single pass through the lookup table
+        holding the scaled value of every possible pixel value, so no full-size floating
+        point temporaries are allocated. The table is computed with the same floating point
+        arithmetic as the generic path, so both produce identical results.
+
+        :param pixels: array of DICOM pixel values.
+        :return: array of uint8 pixel values.
+        """
+        if pixels.dtype.kind not in 'ui' or pixels.dtype.itemsize > 2:
+            pixels = pixels.astype(float)
+            return np.uint8((np.maximum(pixels, 0) / np.amax(pixels)) * 255)
+        # Signed pixels are reinterpreted as unsigned ones, so they can index the table directly.
+        indices = pixels.view(np.dtype(f'u{pixels.dtype.itemsize}'))
+        values = np.arange(1 << (8 * pixels.dtype.itemsize), dtype=indices.dtype).view(pixels.dtype)
+        lut = np.uint8((np.maximum(values.astype(float), 0) / np.amax(pixels)) * 255)
+        return lut[indices]
@@ -0,0 +1,72 @@
+import io
+from PIL import Image
+
+
+class Encoder:
+    """
+    Class responsible for encoding the converted image into the output format.
+
+    Supported formats are lossless PNG, lossy JPEG and WebP (suitable for previews)
+    and raw uint8 pixels passed through as the binary PGM/PPM image.
+
+    Default effort settings were chosen with the benchmarks of the encoders: PNG
+    compression level 3 takes about half of the time of Pillow's default level 6
+    while the output grows by less than 10%, WebP method 0 is 3 times faster than
+    the default method 4 for about 5% larger output.
+    """
+    formats = {
+        'png': ('PNG', 'image/png'),
+        'jpeg': ('JPEG', 'image/jpeg'),
+        'webp': ('WEBP', 'image/webp'),
+        'raw': ('PPM', 'image/x-portable-anymap')
+    }
+    extensions = {'png': 'png', 'jpeg': 'jpg', 'webp': 'webp', 'raw': 'pnm'}
+    default_png_compress_level = 3
+    default_jpeg_quality = 90
+    default_webp_quality = 80
+    default_webp_method = 0
+
+    @staticmethod
+    def encode(
+            im: Image.Image,
+            format: str = 'png',
+            compress_level: int = None,
+            optimize: bool = False,
+            quality: int = None
+    ) -> bytes:
+        """
+        Encode the image into the selected format.
+
+        :param im: uint8 image.
+        :param format: one of the supported formats.
+        :param compress_level: PNG compression level (0-9), for WebP it selects the method (0-6).
+        :param optimize: whether the encoder should make the extra pass to reduce the output size.
+        :param quality: JPEG and WebP quality (1-100).
+        :return: bytes of the encoded image.
+        """
+        pillow_format, _ = Encoder.formats[format]
+        if format == 'png':
+            params = {
+                'compress_level': Encoder.default_png_compress_level if compress_level is None else compress_level,
+                'optimize': optimize
+            }
+        elif format == 'jpeg':
+            params = {'quality': quality or Encoder.default_jpeg_quality, 'optimize': optimize}
+        elif format == 'webp':
+            params = {
+                'quality': quality or Encoder.default_webp_quality,
+                'method': Encoder.default_webp_method if compress_level is None else min(compress_level, 6)
+            }
+        else:
+            params = {}
+        img_byte_arr = io.BytesIO()
+        im.save(img_byte_arr, pillow_format, **params)
+        return img_byte_arr.getvalue()
+
+    @staticmethod
+    def media_type(format: str) -> str:
+        return Encoder.formats[format][1]
+
+    @staticmethod
+    def extension(format: str) -> str:
+        return Encoder.extensions[format]
@@ -0,0 +1,175 @@
+import re
+import typing
+import numpy as np
+import pydicom
+from pydicom.encaps import encapsulate
+
+try:
+    from pydicom.pixels import iter_pixels
+except ImportError:
+    iter_pixels = None
+
+try:
+    from pydicom.encaps import generate_frames
+except ImportError:
+    from pydicom.encaps import generate_pixel_data_frame
+
+    def generate_frames(data: bytes, number_of_frames: int = None) -> typing.Iterator[bytes]:
+        return generate_pixel_data_frame(data, number_of_frames)
+
+
+class FrameSelectionError(ValueError):
+    """
+    Error raised when the frame selector is invalid or out of the image range.
+    """
+    pass
+
+
+class Frames:
+    """
+    Class responsible for selecting and lazily decoding the frames of multi-frame DICOM.
+
+    Frames are selected with the selector being one of:
+        - index of the single frame (e.g. '3'),
+        - half-open range of the frames (e.g. '2:5', '2:' or ':5'),
+        - 'all' for every frame of the image.
+
+    Frames are decoded one at a time, so the memory usage is proportional to a single frame
+    and not to the whole image. Natively encoded frames are read directly from the pixel data,
+    the other ones rely on pydicom per-frame decoding when available. Older pydicom decodes
+    only the whole image, so every encapsulated frame is decoded as the single-frame image.
+    """
+    selector_pattern = re.compile(r'^(all|\d+|\d*:\d*)$')
+    native_photometric_interpretations = ('MONOCHROME1', 'MONOCHROME2', 'RGB', 'PALETTE COLOR')
+    # Elements describing the pixels, copied into the single-frame image of every encapsulated frame.
+    pixel_description_keywords = (
+        'SamplesPerPixel', 'PhotometricInterpretation', 'PlanarConfiguration', 'Rows', 'Columns',
+        'BitsAllocated', 'BitsStored', 'HighBit', 'PixelRepresentation'
+    )
+
+    @staticmethod
+    def valid(selector: typing.Optional[str]) -> bool:
+        return selector is None or Frames.selector_pattern.match(selector) is not None
+
+    @staticmethod
+    def is_single(selector: typing.Optional[str]) -> bool:
+        return selector is None or selector.isdigit()
+
+    @staticmethod
+    def count(dataset: pydicom.Dataset) -> int:
+        return int(dataset.get('NumberOfFrames', 1) or 1)
+
+    @staticmethod
+    def select(selector: typing.Optional[str], count: int) -> typing.List[int]:
+        """
+        Resolve the selector into the indices of the frames.
+
+        :param selector: frames selector, the first frame by default.
+        :param count: number of frames of the image.
+        :return: list of selected frame indices.
+        """
+        if not Frames.valid(selector):
+            raise FrameSelectionError(f'{selector} is not a valid frames selector')
+        if selector is None:
+            indices = [0]
+        elif selector == 'all':
+            indices = list(range(count))
+        elif selector.isdigit():
+            indices = [int(selector)]
+        else:
+            start, stop = selector.split(':')
+            indices = list(range(int(start or 0), min(int(stop or count), count)))
+        if not indices or indices[0] >= count:
+            raise FrameSelectionError(f'{selector} frames are out of range of {count} frames')
+        return indices
+
+    @staticmethod
+    def iterate(dataset: pydicom.Dataset, indices: typing.List[int]) -> typing.Iterator[np.ndarray]:
+        """
+        Decode the selected frames one by one.
+
+        Natively encoded frames are not decoded at all, they are read-only views
+        of the pixel data, so no copy of the pixels is made.
+
+        :param dataset: parsed DICOM dataset.
+        :param indices: indices of the frames to decode.
+        :return: iterator over arrays of the frame pixels.
+        """
+        if (frames := Frames.__native_frames(dataset, indices)) is not None:
+            yield from frames
+        elif Frames.count(dataset) == 1:
+            yield dataset.pixel_array
+        elif iter_pixels is not None:
+            yield from iter_pixels(dataset, indices=indices)
+        elif dataset.file_meta.TransferSyntaxUID.is_compressed:
+            yield from Frames.__encapsulated_frames(dataset, indices)
+        else:
+            # Encapsulated frames can not be decoded separately, so the whole image is decoded.
+            pixels = dataset.pixel_array
+            for index in indices:
+                yield pixels[index]
+
+    @staticmethod
+    def __encapsulated_frames(dataset: pydicom.Dataset, indices: typing.List[int]) -> typing.Iterator[np.ndarray]:
+        selected = set(indices)
+        decoded = {}
+        for index, frame in enumerate(generate_frames(dataset.PixelData, number_of_frames=Frames.count(dataset))):
+            if index in selected:
+                decoded[index] = Frames.__decode_frame(dataset, frame)
+            # Frames are generated in order, the selected ones are sent in the order of indices.
+            while indices and indices[0] in decoded:
+                yield decoded.pop(indices[0])
+                indices = indices[1:]
+            if not indices:
+                return
+
+    @staticmethod
+    def __decode_frame(dataset: pydicom.Dataset, frame: bytes) -> np.ndarray:
+        image = pydicom.Dataset()
+        image.file_meta = dataset.file_meta
+        for keyword in Frames.pixel_description_keywords:
+            if keyword in dataset:
+                setattr(image, keyword, dataset.get(keyword))
+        image.NumberOfFrames = 1
+        image.PixelData = encapsulate([frame])
+        image['PixelData'].VR = 'OB'
+        return image.pixel_array
+
+    @staticmethod
+    def __native_frames(
+            dataset: pydicom.Dataset,
+            indices: typing.List[int]
+    ) -> typing.Optional[typing.Iterator[np.ndarray]]:
+        transfer_syntax = getattr(getattr(dataset, 'file_meta', None), 'TransferSyntaxUID', None)
+        if transfer_syntax is None or transfer_syntax.is_compressed or not transfer_syntax.is_little_endian:
+            return None
+        if 'PixelData' not in dataset or dataset.BitsAllocated not in (8, 16, 32):
+            return None
+        # Colour spaces converted by pydicom and signed pixels with unused bits are decoded by pydicom.
+        if dataset.get('PhotometricInterpretation') not in Frames.native_photometric_interpretations:
+            return None
+        bits_stored = dataset.get('BitsStored', dataset.BitsAllocated)
+        signed = dataset.get('PixelRepresentation', 0) == 1
+        if signed and bits_stored != dataset.BitsAllocated:
+            return None
+        rows, columns, samples = dataset.Rows, dataset.Columns, dataset.get('SamplesPerPixel', 1)
+        dtype = np.dtype(f'<{"i" if signed else "u"}{dataset.BitsAllocated // 8}')
+        length = rows * columns * samples
+        data = dataset.PixelData
+        if len(data) < max(indices) * length * dtype.itemsize + length * dtype.itemsize:
+            return None
+
+        def frames() -> typing.Iterator[np.ndarray]:
+            for index in indices:
+                frame = np.frombuffer(data, dtype, count=length, offset=index * length * dtype.itemsize)
+                if bits_stored < dataset.BitsAllocated:
+                    # Unused high bits are cleared, like pydicom does.
+                    frame = frame & dtype.type((1 << bits_stored) - 1)
+                if samples == 1:
+                    yield frame.reshape(rows, columns)
+                elif dataset.get('PlanarConfiguration', 0):
+                    yield frame.reshape(samples, rows, columns).transpose(1, 2, 0)
+                else:
+                    yield frame.reshape(rows, columns, samples)
+
+        return frames()
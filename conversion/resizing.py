@@ -0,0 +1,92 @@
+import io
+import typing
+import numpy as np
+import pydicom
+from PIL import Image
+
+try:
+    from pydicom.encaps import generate_frames
+except ImportError:
+    from pydicom.encaps import generate_pixel_data_frame as generate_frames
+
+
+class Resizing:
+    """
+    Class responsible for producing the downscaled (preview) images.
+
+    The pixels are downsampled by the integer factor with the block mean before they are
+    mapped into [0, 255] range, so the following stages operate on the reduced image.
+    The final size is reached by resizing the already reduced uint8 image.
+
+    DICOM images compressed with baseline JPEG are decoded directly at the reduced
+    resolution (1/2, 1/4 or 1/8 of the original one), since the codec supports it.
+    """
+    reduced_decoding_transfer_syntaxes = ('1.2.840.10008.1.2.4.50',)
+
+    @staticmethod
+    def target_size(
+            width: int,
+            height: int,
+            max_width: int = None,
+            max_height: int = None,
+            scale: float = None
+    ) -> typing.Optional[typing.Tuple[int, int]]:
+        """
+        Compute the size of the output image preserving the aspect ratio.
+
+        :param width: width of the original image.
+        :param height: height of the original image.
+        :param max_width: maximal width of the output image.
+        :param max_height: maximal height of the output image.
+        :param scale: scale factor of the output image.
+        :return: size (width, height) of the output image or None if the image is not reduced.
+        """
+        ratio = min(
+            scale or 1,
+            max_width / width if max_width else 1,
+            max_height / height if max_height else 1
+        )
+        if ratio >= 1:
+            return None
+        return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+    @staticmethod
+    def decode_reduced(dataset: pydicom.Dataset, size: typing.Tuple[int, int]) -> typing.Optional[np.ndarray]:
+        """
+        Decode the pixels at the reduced resolution, if the transfer syntax supports it.
+
+        :param dataset: parsed DICOM dataset.
+        :param size: requested size of the output image.
+        :return: array of pixels not smaller than the requested size or None if not supported.
+        """
+        transfer_syntax = getattr(getattr(dataset, 'file_meta', None), 'TransferSyntaxUID', None)
+        if transfer_syntax not in Resizing.reduced_decoding_transfer_syntaxes:
+            return None
+        if int(dataset.get('NumberOfFrames', 1) or 1) != 1:
+            return None
+        frame = next(generate_frames(dataset.PixelData))
+        im = Image.open(io.BytesIO(frame))
+        im.draft(im.mode, size)
+        return np.asarray(im)
+
+    @staticmethod
+    def downsample(pixels: np.ndarray, size: typing.Tuple[int, int]) -> np.ndarray:
+        """
+        Downsample the pixels with the block mean by the largest integer factor fitting the size.
+
+        Rows and columns not filling the whole block at the image edges are dropped.
+
+        :param pixels: array of pixels, rows and columns are its first two dimensions.
+        :param size: requested size (width, height) of the output image.
+        :return: array of downsampled pixels of the same type.
+        """
+        height, width = pixels.shape[:2]
+        factor = min(width // size[0], height // size[1])
+        if factor <= 1:
+            return pixels
+        rows, columns = height // factor, width // factor
+        blocks = pixels[:rows * factor, :columns * factor].reshape(rows, factor, columns, factor, *pixels.shape[2:])
+        reduced = blocks.mean(axis=(1, 3))
+        return np.rint(reduced, out=reduced).astype(pixels.dtype) \
+            if pixels.dtype.kind in 'ui' \
+            else reduced.astype(pixels.dtype)
@@ -0,0 +1,116 @@
+import functools
+import typing
+import numpy as np
+import pydicom
+from pydicom.multival import MultiValue
+
+
+class Windowing:
+    """
+    Class responsible for mapping the DICOM pixels into [0, 255] range with the VOI windowing.
+
+    Modality rescale (RescaleSlope, RescaleIntercept) is applied first, then the values
+    are mapped with the linear window (center and width) or with the VOI LUT of the DICOM.
+
+    Window can be selected as:
+        - 'dicom': window (or VOI LUT) stored in the DICOM itself,
+        - 'custom': window provided in the request,
+        - name of one of the presets (center and width in Hounsfield units).
+
+    Integer pixels up to 16 bits are mapped through the lookup tables, which are cached
+    per (pixel type, rescale, window), so images of one series share the same table.
+    """
+    presets = {
+        'brain': (40, 80),
+        'lung': (-600, 1500),
+        'mediastinum': (50, 350),
+        'abdomen': (40, 400),
+        'liver': (60, 160),
+        'bone': (400, 1800)
+    }
+    allowed_windows = ('dicom', 'custom', *presets)
+
+    @staticmethod
+    def apply(
+            dataset: pydicom.Dataset,
+            pixels: np.ndarray,
+            window: str,
+            center: float = None,
+            width: float = None
+    ) -> typing.Optional[np.ndarray]:
+        """
+        Map the pixels into [0, 255] range with the selected window.
+
+        :param dataset: parsed DICOM dataset.
+        :param pixels: array of DICOM pixel values.
+        :param window: one of the allowed windows.
+        :param center: center of the custom window.
+        :param width: width of the custom window.
+        :return: array of uint8 pixel values or None if the DICOM does not define its window.
+        """
+        slope = float(dataset.get('RescaleSlope', 1) or 1)
+        intercept = float(dataset.get('RescaleIntercept', 0) or 0)
+        if window == 'custom':
+            mapping = ('linear', float(center), float(width))
+        elif window == 'dicom':
+            if (mapping := Windowing.__dicom_mapping(dataset)) is None:
+                return None
+        else:
+            mapping = ('linear', *map(float, Windowing.presets[window]))
+        if pixels.dtype.kind not in 'ui' or pixels.dtype.itemsize > 2:
+            return Windowing.__map(pixels, slope, intercept, mapping)
+        lut = Windowing.lut(pixels.dtype.str, slope, intercept, mapping)
+        # Signed pixels are reinterpreted as unsigned ones, so they can index the table directly.
+        return lut[pixels.view(np.dtype(f'u{pixels.dtype.itemsize}'))]
+
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def lut(dtype: str, slope: float, intercept: float, mapping: tuple) -> np.ndarray:
+        """
+        Compute the lookup table holding the windowed value of every possible pixel value.
+
+        :param dtype: numpy type string of the pixels.
+        :param slope: modality rescale slope.
+        :param intercept: modality rescale intercept.
+        :param mapping: hashable description of the window.
+        :return: read-only uint8 lookup table indexed by the unsigned pixel value.
+        """
+        itemsize = np.dtype(dtype).itemsize
+        values = np.arange(1 << (8 * itemsize), dtype=np.dtype(f'u{itemsize}')).view(dtype)
+        lut = Windowing.__map(values, slope, intercept, mapping)
+        # The table is shared between requests, so it must not be modified.
+        lut.setflags(write=False)
+        return lut
+
+    @staticmethod
+    def __map(values: np.ndarray, slope: float, intercept: float, mapping: tuple) -> np.ndarray:
+        values = values * slope + intercept
+        if mapping[0] == 'lut':
+            _, first_mapped, bits, data = mapping
+            table = np.frombuffer(data, dtype=np.uint16)
+            indices = np.clip(values - first_mapped, 0, table.size - 1).astype(np.intp)
+            return np.uint8(table[indices] * (255 / ((1 << bits) - 1)))
+        # Linear VOI function as defined by DICOM PS3.3 C.11.2.1.2.
+        _, center, width = mapping
+        if width <= 1:
+            return np.where(values <= center - 0.5, 0, 255).astype(np.uint8)
+        values = ((values - (center - 0.5)) / (width - 1) + 0.5) * 255
+        return np.uint8(np.clip(values, 0, 255))
+
+    @staticmethod
+    def __dicom_mapping(dataset: pydicom.Dataset) -> typing.Optional[tuple]:
+        if 'VOILUTSequence' in dataset and len(dataset.VOILUTSequence) > 0:
+            item = dataset.VOILUTSequence[0]
+            entries, first_mapped, bits = item.LUTDescriptor
+            data = item.LUTData
+            # LUT data encoded as OW is returned as raw little endian bytes.
+            data = np.frombuffer(data, dtype='<u2') if isinstance(data, bytes) else np.asarray(data, dtype=np.uint16)
+            data = data.astype(np.uint16)[:entries or 65536]
+            return 'lut', int(first_mapped), int(bits), data.tobytes()
+        if 'WindowCenter' in dataset and 'WindowWidth' in dataset:
+            center, width = dataset.WindowCenter, dataset.WindowWidth
+            # Multi-valued window attributes hold alternative windows, the first one is used.
+            center = center[0] if isinstance(center, MultiValue) else center
+            width = width[0] if isinstance(width, MultiValue) else width
+            return 'linear', float(center), float(width)
+        return None
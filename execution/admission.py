@@ -0,0 +1,128 @@
+import asyncio
+import typing
+
+if typing.TYPE_CHECKING:
+    # The estimate only reads the header elements, so pydicom is not imported with the service.
+    import pydicom
+
+
+class AdmissionError(Exception):
+    """
+    Error raised when the request was not admitted within the timeout.
+    """
+    pass
+
+
+class MemoryEstimate:
+    """
+    Class responsible for predicting the peak memory used by the conversion of the request.
+
+    The first estimate is based only on the size of the submitted payload. Once the DICOM
+    header is read, it is replaced by the estimate based on the image geometry: the decompressed
+    pixel data (held twice, by the decompression output and the parsed dataset) and the working
+    set of a single decoded frame (pixels, floating point temporaries and the output image).
+    """
+    payload_expansion = 4
+    frame_overhead = 10
+
+    @staticmethod
+    def from_payload(size: int, limit: int) -> int:
+        """
+        :param size: size of the submitted (possibly compressed) payload.
+        :param limit: maximal size of the decompressed data.
+        :return: predicted peak memory in bytes.
+        """
+        return 2 * min(size * MemoryEstimate.payload_expansion, limit)
+
+    @staticmethod
+    def from_header(dataset: 'pydicom.Dataset') -> typing.Optional[int]:
+        """
+        :param dataset: DICOM dataset with the header elements.
+        :return: predicted peak memory in bytes or None if the header lacks the image geometry.
+        """
+        if any(keyword not in dataset for keyword in ('Rows', 'Columns', 'BitsAllocated')):
+            return None
+        pixels = dataset.Rows * dataset.Columns * int(dataset.get('SamplesPerPixel', 1) or 1)
+        pixel_size = (dataset.BitsAllocated + 7) // 8
+        frames = int(dataset.get('NumberOfFrames', 1) or 1)
+        return 2 * pixels * pixel_size * frames + pixels * (pixel_size + MemoryEstimate.frame_overhead)
+
+
+class AdmissionController:
+    """
+    Class admitting the conversions against the global memory budget.
+
+    Every conversion reserves its predicted peak memory before it is started and releases it
+    when it finishes. Conversions not fitting the budget wait until enough memory is released,
+    or are rejected with AdmissionError when the timeout elapses. A conversion larger than
+    the whole budget is admitted only when nothing else is running.
+
+    The controller is used only from the event loop, so it does not need any locking.
+    The budget equal to 0 disables the admission control.
+    """
+    def __init__(self, budget: int, timeout: float = 0):
+        self.budget = budget
+        self.timeout = timeout
+        self.used = 0
+        self.rejected = 0
+        self.__waiters = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget > 0
+
+    async def acquire(self, cost: int) -> int:
+        """
+        Reserve the memory for the conversion.
+
+        :param cost: predicted peak memory of the conversion.
+        :return: reserved memory, which must be released afterwards.
+        """
+        await self.__wait(lambda: self.used == 0 or self.used + cost <= self.budget)
+        self.used += cost
+        return cost
+
+    async def resize(self, reserved: int, cost: int) -> int:
+        """
+        Change the reservation to the refined cost, waiting if it has grown.
+
+        The original reservation is kept when the grown one is rejected.
+
+        :param reserved: memory reserved so far.
+        :param cost: refined peak memory of the conversion.
+        :return: reserved memory, which must be released afterwards.
+        """
+        if cost > reserved:
+            await self.__wait(lambda: self.used == reserved or self.used - reserved + cost <= self.budget)
+        self.used += cost - reserved
+        if cost < reserved:
+            self.__notify()
+        return cost
+
+    def release(self, reserved: int):
+        self.used -= reserved
+        self.__notify()
+
+    async def __wait(self, fits: typing.Callable[[], bool]):
+        if not self.enabled:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        while not fits():
+            if (remaining := deadline - loop.time()) <= 0:
+                self.rejected += 1
+                raise AdmissionError
+            waiter = loop.create_future()
+            self.__waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self.__waiters.remove(waiter)
+
+    def __notify(self):
+        # Every waiter checks on its own whether it fits the released memory.
+        for waiter in self.__waiters:
+            if not waiter.done():
+                waiter.set_result(None)
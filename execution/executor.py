@@ -0,0 +1,111 @@
+import asyncio
+import os
+import typing
+import threading
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class QueueFullError(Exception):
+    """
+    Error raised when the executor can not accept any more jobs.
+    """
+    pass
+
+
+class JobTimeoutError(Exception):
+    """
+    Error raised when the job did not finish within the configured timeout.
+    """
+    pass
+
+
+class Executor:
+    """
+    Class responsible for executing the CPU-bound jobs outside the event loop.
+
+    Two execution modes are supported:
+        - 'inline': the job is executed directly by the calling coroutine,
+        - 'process': the job is executed inside a pool of worker processes.
+
+    In 'process' mode the number of accepted, but not yet finished, jobs is bounded
+    by the number of workers increased by the queue size. Jobs submitted above
+    this limit are rejected with QueueFullError instead of being queued without limit.
+    """
+    allowed_modes = ('inline', 'process')
+
+    def __init__(self, mode: str = 'inline', workers: int = None, queue_size: int = 0, timeout: float = None):
+        if mode not in Executor.allowed_modes:
+            raise ValueError(f'{mode} execution mode is not supported')
+        self.mode = mode
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.pending = 0
+        self.__lock = threading.Lock()
+        self.__pool = None
+
+    @property
+    def capacity(self) -> int:
+        return (self.workers or os.cpu_count() or 1) + self.queue_size
+
+    async def submit(self, fn: typing.Callable, *args) -> typing.Any:
+        """
+        Execute the job accordingly to the execution mode.
+
+        :param fn: picklable function representing the job.
+        :param args: picklable arguments of the job.
+        :return: result of the job.
+        """
+        if self.mode == 'inline':
+            return fn(*args)
+        with self.__lock:
+            if self.pending >= self.capacity:
+                raise QueueFullError
+            self.pending += 1
+        pool = None
+        try:
+            pool = self.__get_pool()
+            future = pool.submit(fn, *args)
+        except BaseException as e:
+            # The job was not accepted by the pool, so it does not occupy the slot.
+            self.__release(None)
+            if isinstance(e, BrokenProcessPool):
+                # Worker died while idle, the pool is broken before the job was even queued.
+                self.shutdown(pool)
+            raise
+        # The job occupies the worker until it really finishes, even if the caller timed out.
+        future.add_done_callback(self.__release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            # Queued job can be dropped, the already running one will finish in the background.
+            future.cancel()
+            raise JobTimeoutError
+        except BrokenProcessPool:
+            # One of the workers died, so the pool is recreated for the next jobs.
+            self.shutdown(pool)
+            raise
+
+    def shutdown(self, pool: ProcessPoolExecutor = None):
+        """
+        Shut the pool down, the next job creates the new one.
+
+        :param pool: pool to shut down, only when it is still the current one, the current pool by default.
+        """
+        with self.__lock:
+            if self.__pool is None or (pool is not None and pool is not self.__pool):
+                # Late callers of the broken pool must not shut the freshly created one down.
+                return
+            pool, self.__pool = self.__pool, None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def __release(self, _):
+        with self.__lock:
+            self.pending -= 1
+
+    def __get_pool(self) -> ProcessPoolExecutor:
+        if self.__pool is None:
+            self.__pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self.__pool
@@ -0,0 +1,160 @@
+import typing
+
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+
+class Segment(typing.NamedTuple):
+    """
+    Descriptor of the shared memory segment, the only thing sent to the worker process.
+    """
+    name: str
+    size: int
+    text: bool = False
+
+
+class Slice(typing.NamedTuple):
+    """
+    Placeholder of the result bytes written into the output segment by the worker.
+    """
+    offset: int
+    length: int
+
+
+class SharedMemoryTransport:
+    """
+    Class passing the payloads and the results of the jobs through the shared memory.
+
+    The payload is written into the input segment and the worker writes the result photos
+    into the output segment, so only the small descriptors are pickled and sent through
+    the pipes, whatever the size of the image is. Results not fitting the output segment
+    are returned the usual way.
+
+    Segments are created and owned by the service process and reused by the following jobs,
+    the pool keeps at most max_segments idle ones. Segments of the failed jobs (timed out,
+    or whose worker crashed) are unlinked instead of being reused, since the worker may
+    still be writing into them. The transport is used only from the event loop.
+    """
+    minimal_size = 1 << 20
+
+    def __init__(self, max_segments: int):
+        self.max_segments = max_segments
+        self.__idle = []
+        self.__used = {}
+        # Workers forked afterwards share the tracker, so they never unlink the segments on exit.
+        resource_tracker.ensure_running()
+
+    def acquire(self, payload: typing.Union[str, bytes]) -> typing.Tuple[Segment, Segment]:
+        """
+        Write the payload into the input segment and reserve the output segment.
+
+        :param payload: image data of the job.
+        :return: descriptors of the input and the output segment.
+        """
+        data = payload.encode('ascii') if isinstance(payload, str) else payload
+        source = self.__take(len(data))
+        try:
+            source.buf[:len(data)] = data
+            # Encoded photos are mostly smaller than the compressed payload, the output segment has some margin.
+            target = self.__take(2 * len(data))
+        except BaseException:
+            # Nothing else uses the source segment yet, so it is put back into the pool.
+            self.release(Segment(source.name, source.size))
+            raise
+        return Segment(source.name, len(data), isinstance(payload, str)), Segment(target.name, target.size)
+
+    def release(self, *segments: Segment):
+        for segment in segments:
+            shm = self.__used.pop(segment.name)
+            if len(self.__idle) < self.max_segments:
+                self.__idle.append(shm)
+            else:
+                SharedMemoryTransport.__destroy(shm)
+
+    def discard(self, *segments: Segment):
+        for segment in segments:
+            SharedMemoryTransport.__destroy(self.__used.pop(segment.name))
+
+    def unpack(self, result: dict, target: Segment) -> dict:
+        """
+        Replace the result placeholders with the bytes copied from the output segment.
+        """
+        shm = self.__used[target.name]
+        if isinstance(result.get('photo'), Slice):
+            result['photo'] = SharedMemoryTransport.__read(shm, result['photo'])
+        if 'frames' in result:
+            result['frames'] = [
+                (index, SharedMemoryTransport.__read(shm, photo) if isinstance(photo, Slice) else photo)
+                for index, photo in result['frames']
+            ]
+        return result
+
+    def close(self):
+        for shm in [*self.__idle, *self.__used.values()]:
+            SharedMemoryTransport.__destroy(shm)
+        self.__idle, self.__used = [], {}
+
+    def __take(self, size: int) -> SharedMemory:
+        if fitting := [shm for shm in self.__idle if shm.size >= size]:
+            shm = min(fitting, key=lambda segment: segment.size)
+            self.__idle.remove(shm)
+        else:
+            # Sizes are rounded up to the power of two, so the segments are reusable by similar jobs.
+            size = max(SharedMemoryTransport.minimal_size, 1 << (size - 1).bit_length())
+            shm = SharedMemory(create=True, size=size)
+        self.__used[shm.name] = shm
+        return shm
+
+    @staticmethod
+    def __read(shm: SharedMemory, photo: Slice) -> bytes:
+        return bytes(shm.buf[photo.offset:photo.offset + photo.length])
+
+    @staticmethod
+    def __destroy(shm: SharedMemory):
+        shm.close()
+        shm.unlink()
+
+
+def run_in_segments(fn: typing.Callable, source: Segment, target: Segment, *args) -> dict:
+    """
+    Execute the pipeline function inside the worker on the payload read from the input segment.
+
+    :param fn: pipeline function taking the payload as the first argument.
+    :param source: descriptor of the input segment.
+    :param target: descriptor of the output segment.
+    :param args: remaining arguments of the function.
+    :return: result of the function with the photos replaced by the output segment slices.
+    """
+    shm = __attach(source.name)
+    try:
+        payload = str(shm.buf[:source.size], 'ascii') if source.text else bytes(shm.buf[:source.size])
+    finally:
+        shm.close()
+    result = fn(payload, *args)
+    shm = __attach(target.name)
+    try:
+        offset = 0
+
+        def write(photo: bytes) -> typing.Union[bytes, Slice]:
+            nonlocal offset
+            if offset + len(photo) > target.size:
+                return photo
+            shm.buf[offset:offset + len(photo)] = photo
+            offset += len(photo)
+            return Slice(offset - len(photo), len(photo))
+
+        if 'photo' in result:
+            result['photo'] = write(result['photo'])
+        if 'frames' in result:
+            result['frames'] = [(index, write(photo)) for index, photo in result['frames']]
+    finally:
+        shm.close()
+    return result
+
+
+def __attach(name: str) -> SharedMemory:
+    try:
+        # The service process owns the segment, so the worker must not track it on its own.
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        return SharedMemory(name=name)
@@ -0,0 +1,109 @@
+import time
+import uuid
+import heapq
+import typing
+import itertools
+
+
+class JobStoreFullError(Exception):
+    """
+    Error raised when the store can not accept any more jobs.
+    """
+    pass
+
+
+class Job:
+    """
+    Class representing the state of the single asynchronous conversion job.
+    """
+    allowed_statuses = ('pending', 'running', 'done', 'failed')
+
+    def __init__(self, request: typing.Any, priority: int = 0):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.priority = priority
+        self.status = 'pending'
+        self.result = None
+        self.status_code = None
+        self.detail = None
+        self.finished = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ('done', 'failed')
+
+
+class JobStore:
+    """
+    Class implementing bounded in-memory store of the asynchronous conversion jobs.
+
+    Pending jobs are handed out by their priority (higher first), jobs of the same
+    priority in the order of submission. Finished jobs are kept for the TTL seconds,
+    so their results can be fetched, and are removed afterwards. When the store is full
+    the oldest finished jobs are evicted first, unfinished jobs are never evicted.
+
+    The store is used only from the event loop, so it does not need any locking.
+    """
+    def __init__(self, capacity: int, ttl: float):
+        self.capacity = capacity
+        self.ttl = ttl
+        # Number of coroutines currently running the pending jobs.
+        self.runners = 0
+        self.__jobs = {}
+        self.__pending = []
+        self.__order = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self.__jobs)
+
+    def create(self, request: typing.Any, priority: int = 0) -> Job:
+        self.__expire()
+        if len(self.__jobs) >= self.capacity and not self.__evict():
+            raise JobStoreFullError
+        job = Job(request, priority)
+        self.__jobs[job.id] = job
+        heapq.heappush(self.__pending, (-priority, next(self.__order), job.id))
+        return job
+
+    def get(self, job_id: str) -> typing.Optional[Job]:
+        self.__expire()
+        return self.__jobs.get(job_id)
+
+    def next(self) -> typing.Optional[Job]:
+        """
+        Take the most important pending job and mark it as running.
+
+        :return: the job to run or None if there are no pending jobs.
+        """
+        while self.__pending:
+            _, _, job_id = heapq.heappop(self.__pending)
+            if (job := self.__jobs.get(job_id)) is not None:
+                job.status = 'running'
+                return job
+        return None
+
+    def finish(self, job: Job, result: dict):
+        job.status = 'done'
+        job.result = result
+        job.finished = time.monotonic()
+        # The request is not necessary anymore, so its (possibly large) image is released.
+        job.request = None
+
+    def fail(self, job: Job, status_code: int, detail: str):
+        job.status = 'failed'
+        job.status_code = status_code
+        job.detail = detail
+        job.finished = time.monotonic()
+        job.request = None
+
+    def __expire(self):
+        deadline = time.monotonic() - self.ttl
+        for job_id in [job.id for job in self.__jobs.values() if job.is_finished and job.finished < deadline]:
+            del self.__jobs[job_id]
+
+    def __evict(self) -> bool:
+        finished = [job for job in self.__jobs.values() if job.is_finished]
+        if not finished:
+            return False
+        del self.__jobs[min(finished, key=lambda job: job.finished).id]
+        return True
@@ -1,38 +1,194 @@
-import base64
-import io
 import os
+import re
+import json
+import base64
+import time
+import typing
+import asyncio
 import logging
+import contextlib
 
+from concurrent.futures.process import BrokenProcessPool
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Security, status
+from fastapi import FastAPI, HTTPException, Security, Depends, status, responses
+from fastapi import Request as HTTPRequest
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from pydantic import BaseModel
-from conversion.converter import Converter
+from pydantic import BaseModel, Field
+from archives.reader import ArchiveReader, ArchiveError, Member, MemberTooLargeError
+from archives.writer import ArchiveWriter
+from caching.cache import ResultCache
+from caching.single_flight import SingleFlight
 from compression.decompressor import Decompressor
-from attributes.reader import AttributesReader
+from execution.admission import AdmissionController, AdmissionError, MemoryEstimate
+from execution.executor import Executor, QueueFullError, JobTimeoutError
+from execution.transport import SharedMemoryTransport, run_in_segments
+from jobs.store import Job, JobStore, JobStoreFullError
+from monitoring import metrics
+from monitoring.metrics import Counter, Gauge
+from pipeline.errors import PipelineError
+
+# Modules depending on pydicom, NumPy and Pillow are imported inside the functions using them,
+# so the service starts (and binds its port) quickly. They are loaded by the warm-up or the first request.
+
 
+class Options(BaseModel):
+    window: typing.Optional[str] = None
+    window_center: typing.Optional[float] = None
+    window_width: typing.Optional[float] = None
+    max_width: typing.Optional[int] = Field(None, gt=0)
+    max_height: typing.Optional[int] = Field(None, gt=0)
+    scale: typing.Optional[float] = Field(None, gt=0, le=1)
+    format: str = 'png'
+    compress_level: typing.Optional[int] = Field(None, ge=0, le=9)
+    optimize: bool = False
+    quality: typing.Optional[int] = Field(None, ge=1, le=100)
+    frames: typing.Optional[str] = None
 
-class Request(BaseModel):
+
+class Request(Options):
     compression: str
     image: str
     encoded: bool
+    attributes: typing.Optional[typing.List[str]] = None
+    attributes_only: bool = False
+    stream: bool = False
 
 
 class Response(BaseModel):
-    photo: str
+    photo: typing.Optional[str] = None
+    attributes: dict
+
+
+class AttributesResponse(BaseModel):
     attributes: dict
 
 
+class JobRequest(Request):
+    priority: int = 0
+
+
+class JobResponse(BaseModel):
+    id: str
+    status: str
+    priority: int
+    detail: typing.Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+    items: typing.List[Request]
+    ordered: bool = True
+
+
 ACCESS_TOKEN_ENV_KEY = 'ACCESS_TOKEN'
+EXECUTION_MODE_ENV_KEY = 'EXECUTION_MODE'
+EXECUTION_WORKERS_ENV_KEY = 'EXECUTION_WORKERS'
+EXECUTION_QUEUE_SIZE_ENV_KEY = 'EXECUTION_QUEUE_SIZE'
+EXECUTION_TIMEOUT_ENV_KEY = 'EXECUTION_TIMEOUT'
+EXECUTION_SHARED_MEMORY_SEGMENTS_ENV_KEY = 'EXECUTION_SHARED_MEMORY_SEGMENTS'
+CACHE_BUDGET_ENV_KEY = 'CACHE_BUDGET'
+CACHE_DIRECTORY_ENV_KEY = 'CACHE_DIRECTORY'
+CACHE_DIRECTORY_BUDGET_ENV_KEY = 'CACHE_DIRECTORY_BUDGET'
+DECOMPRESSION_LIMIT_ENV_KEY = 'DECOMPRESSION_LIMIT'
+DEBUG_ALLOCATIONS_ENV_KEY = 'DEBUG_ALLOCATIONS'
+WARM_UP_ENV_KEY = 'WARM_UP'
+JOBS_CAPACITY_ENV_KEY = 'JOBS_CAPACITY'
+ADMISSION_BUDGET_ENV_KEY = 'ADMISSION_BUDGET'
+ADMISSION_TIMEOUT_ENV_KEY = 'ADMISSION_TIMEOUT'
+JOBS_TTL_ENV_KEY = 'JOBS_TTL'
+RETRY_AFTER_SECONDS = 1
+HEADER_PEEK_SIZE = 64 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+ATTRIBUTES_HEADER = 'X-DICOM-Attributes'
+BINARY_MEDIA_TYPE = 'application/octet-stream'
+BATCH_MEDIA_TYPE = 'application/x-ndjson'
+METRICS_MEDIA_TYPE = 'text/plain; version=0.0.4'
+FRAMES_MEDIA_TYPE = 'application/x-ndjson'
+FRAMES_BOUNDARY = 'dicom-frame'
+UNSUPPORTED_LABEL = 'unsupported'
+ARCHIVE_FORMATS = {'application/zip': 'zip', 'application/x-zip-compressed': 'zip', 'application/x-tar': 'tar'}
+ARCHIVE_MANIFEST_NAME = 'manifest.json'
+ARCHIVE_SPOOL_SIZE = 16 * 1024 * 1024
+DICOM_SUFFIX_PATTERN = re.compile(r'\.(dcm|dicom)$', re.IGNORECASE)
 
 # Preparing the environment of the service.
 load_dotenv()
 
 security = HTTPBearer()
 app = FastAPI()
-decompressor = Decompressor()
-converter = Converter()
-attributes_reader = AttributesReader()
+# Worker processes are forked, so they inherit the limit set here.
+Decompressor.max_output_size = int(os.getenv(DECOMPRESSION_LIMIT_ENV_KEY, Decompressor.max_output_size))
+trace_allocations = os.getenv(DEBUG_ALLOCATIONS_ENV_KEY, '').lower() in ('1', 'true', 'yes')
+warm_up = os.getenv(WARM_UP_ENV_KEY, '1').lower() in ('1', 'true', 'yes')
+# Readiness of the service, it is not ready until the warm-up finished.
+readiness = {'ready': not warm_up, 'warm_up_seconds': None}
+executor = Executor(
+    mode=os.getenv(EXECUTION_MODE_ENV_KEY, 'inline'),
+    workers=int(os.getenv(EXECUTION_WORKERS_ENV_KEY, 0)) or None,
+    queue_size=int(os.getenv(EXECUTION_QUEUE_SIZE_ENV_KEY, 16)),
+    timeout=float(os.getenv(EXECUTION_TIMEOUT_ENV_KEY, 0)) or None
+)
+# Payloads and results of the worker processes are passed through the shared memory.
+shared_memory_segments = int(os.getenv(EXECUTION_SHARED_MEMORY_SEGMENTS_ENV_KEY, 8))
+transport = SharedMemoryTransport(shared_memory_segments) \
+    if executor.mode == 'process' and shared_memory_segments > 0 \
+    else None
+cache = ResultCache(
+    budget=int(os.getenv(CACHE_BUDGET_ENV_KEY, 64 * 1024 * 1024)),
+    directory=os.getenv(CACHE_DIRECTORY_ENV_KEY),
+    directory_budget=int(os.getenv(CACHE_DIRECTORY_BUDGET_ENV_KEY, 1024 * 1024 * 1024))
+)
+admission = AdmissionController(
+    budget=int(os.getenv(ADMISSION_BUDGET_ENV_KEY, 0)),
+    timeout=float(os.getenv(ADMISSION_TIMEOUT_ENV_KEY, 10))
+)
+# Concurrent identical requests wait for the single conversion.
+single_flight = SingleFlight()
+jobs = JobStore(
+    capacity=int(os.getenv(JOBS_CAPACITY_ENV_KEY, 256)),
+    ttl=float(os.getenv(JOBS_TTL_ENV_KEY, 3600))
+)
+# Running jobs coroutines are referenced here, so they are not garbage collected.
+job_tasks = set()
+# Metrics reading the state of the service objects when they are scraped.
+metrics.registry.register(Gauge(
+    'dicom_executor_queue_depth', 'Number of jobs accepted by the executor.', lambda: executor.pending
+))
+metrics.registry.register(Counter(
+    'dicom_cache_hits_total', 'Number of results served from the cache.', lambda: cache.hits
+))
+metrics.registry.register(Counter(
+    'dicom_cache_misses_total', 'Number of results not found in the cache.', lambda: cache.misses
+))
+metrics.registry.register(Counter(
+    'dicom_coalesced_requests_total', 'Number of requests sharing the in-flight conversion.',
+    lambda: single_flight.coalesced
+))
+metrics.registry.register(Gauge(
+    'dicom_admission_reserved_bytes', 'Predicted memory of the admitted conversions.', lambda: admission.used
+))
+metrics.registry.register(Counter(
+    'dicom_admission_rejected_total', 'Number of conversions rejected by the admission control.',
+    lambda: admission.rejected
+))
+metrics.registry.register(Gauge(
+    'dicom_cache_size_bytes', 'Size of the results stored in the cache.', lambda: cache.size
+))
+
+
+@app.on_event('startup')
+async def startup():
+    # Warm-up runs in the background, so the service accepts the requests in the meantime.
+    if warm_up:
+        task = asyncio.ensure_future(__warm_up())
+        job_tasks.add(task)
+        task.add_done_callback(job_tasks.discard)
+
+
+@app.on_event('shutdown')
+def shutdown():
+    executor.shutdown()
+    if transport is not None:
+        transport.close()
 
 
 @app.get("/")
@@ -42,57 +198,550 @@ async def main() -> dict:
     }
 
 
+@app.get('/ready')
+async def ready():
+    return responses.JSONResponse(
+        content=readiness,
+        status_code=status.HTTP_200_OK if readiness['ready'] else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
+
+@app.get('/metrics')
+async def read_metrics():
+    return responses.Response(content=metrics.registry.render(), media_type=METRICS_MEDIA_TYPE)
+
+
 @app.post('/convert')
 async def convert(req: Request, credentials: HTTPAuthorizationCredentials = Security(security)):
     if not __valid_credentials(credentials.credentials):
         raise HTTPException(status.HTTP_403_FORBIDDEN, 'Invalid access token')
-    # Start of the conversion pipeline.
-    decompressed_data = __decompress(req)
-    converted_data = __convert(decompressed_data)
-    encoded_data = __encode(converted_data)
-    # Read the pixel spacing attribute, necessary by some micro-services.
-    attributes = __read_attributes(decompressed_data)
+    # Streamed photo is base64 encoded while it is sent, so the encoded copy is never built.
+    result = await __convert_request(req, req.attributes_only, encode_photo=not req.stream)
     # Finish of the endpoint.
-    return Response(
-        photo=encoded_data,
-        attributes=attributes
+    return __convert_response(result, req.stream)
+
+
+@app.post('/attributes')
+async def read_attributes(req: Request, credentials: HTTPAuthorizationCredentials = Security(security)):
+    if not __valid_credentials(credentials.credentials):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, 'Invalid access token')
+    # Only the DICOM header is parsed, the image itself is not converted.
+    result = await __convert_request(req, attributes_only=True)
+    return AttributesResponse(attributes=result['attributes'])
+
+
+@app.post('/convert/batch')
+async def convert_batch(req: BatchRequest, credentials: HTTPAuthorizationCredentials = Security(security)):
+    if not __valid_credentials(credentials.credentials):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, 'Invalid access token')
+    # Every item is sent as a separate JSON line, as soon as it is ready to be sent.
+    return responses.StreamingResponse(
+        __stream_batch(req.items, req.ordered),
+        media_type=BATCH_MEDIA_TYPE
     )
 
 
+@app.post('/jobs', status_code=status.HTTP_202_ACCEPTED)
+async def create_job(req: JobRequest, credentials: HTTPAuthorizationCredentials = Security(security)):
+    if not __valid_credentials(credentials.credentials):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, 'Invalid access token')
+    # Invalid requests are rejected at once, instead of creating the job which would fail.
+    __options(req)
+    __attributes(req.attributes)
+    try:
+        job = jobs.create(req, req.priority)
+    except JobStoreFullError:
+        raise HTTPException(
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            'Too many jobs, try again later',
+            headers={'Retry-After': str(RETRY_AFTER_SECONDS)}
+        )
+    # Jobs are run concurrently by at most as many coroutines as there are workers.
+    if jobs.runners < (executor.workers or os.cpu_count() or 1):
+        jobs.runners += 1
+        task = asyncio.ensure_future(__run_jobs())
+        job_tasks.add(task)
+        task.add_done_callback(job_tasks.discard)
+    return __job_response(job)
+
+
+@app.get('/jobs/{job_id}')
+async def read_job(job_id: str, credentials: HTTPAuthorizationCredentials = Security(security)):
+    if not __valid_credentials(credentials.credentials):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, 'Invalid access token')
+    return __job_response(__job(job_id))
+
+
+@app.get('/jobs/{job_id}/result')
+async def read_job_result(job_id: str, credentials: HTTPAuthorizationCredentials = Security(security)):
+    if not __valid_credentials(credentials.credentials):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, 'Invalid access token')
+    job = __job(job_id)
+    if job.status == 'failed':
+        raise HTTPException(job.status_code, job.detail)
+    if job.status != 'done':
+        raise HTTPException(status.HTTP_409_CONFLICT, f'Job is {job.status}')
+    return __convert_response(job.result)
+
+
+@app.post('/convert/binary')
+async def convert_binary(
+        req: HTTPRequest,
+        options: Options = Depends(),
+        credentials: HTTPAuthorizationCredentials = Security(security)
+):
+    if not __valid_credentials(credentials.credentials):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, 'Invalid access token')
+    if req.headers.get('Content-Type', BINARY_MEDIA_TYPE).split(';')[0].strip() != BINARY_MEDIA_TYPE:
+        raise HTTPException(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, f'Only {BINARY_MEDIA_TYPE} body is supported')
+    options = __options(options)
+    data = await req.body()
+    content_encoding = req.headers.get('Content-Encoding', 'identity')
+    metrics.requests_total.inc(
+        endpoint='binary',
+        compression=__metric_label(content_encoding.strip().lower(), Decompressor.allowed_content_encodings)
+    )
+    # Resubmitted studies are served from the cache.
+    key = ResultCache.key(data, 'binary', content_encoding, json.dumps(options, sort_keys=True))
+    if (result := await cache.get(key)) is None:
+        result = await single_flight.run(key, lambda: __convert_binary(key, data, content_encoding, options))
+    # Multiple frames are sent one after another as parts of the multipart response.
+    if 'frames' in result:
+        return responses.StreamingResponse(
+            __stream_frame_parts(result, __media_type(options['format'])),
+            media_type=f'multipart/mixed; boundary={FRAMES_BOUNDARY}',
+            headers={ATTRIBUTES_HEADER: json.dumps(result['attributes'])}
+        )
+    # Finish of the endpoint, the attributes are sent within the header.
+    return responses.Response(
+        content=result['photo'],
+        media_type=__media_type(options['format']),
+        headers={ATTRIBUTES_HEADER: json.dumps(result['attributes'])}
+    )
+
+
+@app.post('/convert/archive')
+async def convert_archive(
+        req: HTTPRequest,
+        options: Options = Depends(),
+        credentials: HTTPAuthorizationCredentials = Security(security)
+):
+    if not __valid_credentials(credentials.credentials):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, 'Invalid access token')
+    media_type = req.headers.get('Content-Type', '').split(';')[0].strip()
+    if (archive_format := ARCHIVE_FORMATS.get(media_type)) is None:
+        raise HTTPException(
+            status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, f'Only {", ".join(ARCHIVE_FORMATS)} body is supported'
+        )
+    options = __options(options)
+    metrics.requests_total.inc(endpoint='archive', compression=archive_format)
+    # Converted files are written into the archive of the same format as the submitted one.
+    writer = ArchiveWriter(archive_format, ARCHIVE_SPOOL_SIZE)
+    try:
+        manifest = await __convert_archive(
+            req, ArchiveReader(archive_format, Decompressor.max_output_size), writer, options
+        )
+        await asyncio.to_thread(writer.add, ARCHIVE_MANIFEST_NAME, json.dumps(manifest).encode())
+    except ArchiveError as e:
+        writer.close()
+        metrics.errors_total.inc(error=type(e).__name__, status=status.HTTP_400_BAD_REQUEST)
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(e))
+    except BaseException:
+        writer.close()
+        raise
+    return responses.StreamingResponse(writer.stream(STREAM_CHUNK_SIZE), media_type=writer.media_type)
+
+
+def __metric_label(value: str, allowed: typing.Iterable[str]) -> str:
+    # Values sent by the client are not used as labels as they are, so the number of series is bounded.
+    return value if value in allowed else UNSUPPORTED_LABEL
+
+
 def __valid_credentials(credentials: str) -> bool:
     return credentials == os.getenv(ACCESS_TOKEN_ENV_KEY)
 
 
-def __decompress(req: Request) -> bytes:
+def __pipeline():
+    from pipeline import pipeline
+    pipeline.trace_allocations = trace_allocations
+    return pipeline
+
+
+def __media_type(output_format: str) -> str:
+    from conversion.encoding import Encoder
+    return Encoder.media_type(output_format)
+
+
+def __extension(output_format: str) -> str:
+    from conversion.encoding import Encoder
+    return Encoder.extension(output_format)
+
+
+async def __warm_up():
+    start = time.perf_counter()
     try:
-        return Decompressor.decompress(req.image, req.compression, req.encoded)
-    except NotImplementedError:
-        logging.error(f'Decompress: {req.compression} compression is not supported')
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, f'{req.compression} compression is not supported')
+        # Heavy modules are imported in the thread, so the event loop keeps serving the requests.
+        pipeline = await asyncio.to_thread(__pipeline)
+        if executor.mode == 'process':
+            # Every worker process runs the pipeline once.
+            await asyncio.gather(*(
+                executor.submit(pipeline.warm_up) for _ in range(executor.workers or os.cpu_count() or 1)
+            ))
+        else:
+            # Inline executor would run the pipeline on the event loop, so it runs in the thread instead.
+            await asyncio.to_thread(pipeline.warm_up)
+        readiness['warm_up_seconds'] = time.perf_counter() - start
+        logging.info(f'Warm-up finished in {readiness["warm_up_seconds"]:.3f} seconds')
     except Exception as e:
-        logging.error(f'Decompress error: {e}')
-        raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, 'Internal decompression error occurred')
+        # The service still works, only the first requests are slower.
+        logging.error(f'Warm-up error: {e}')
+    finally:
+        readiness['ready'] = True
+
+
+def __options(options: Options) -> dict:
+    from conversion.encoding import Encoder
+    from conversion.frames import Frames
+    from conversion.windowing import Windowing
+    if options.format not in Encoder.formats:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f'{options.format} format is not supported')
+    if options.window is not None and options.window not in Windowing.allowed_windows:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f'{options.window} window is not supported')
+    if options.window == 'custom' and (options.window_center is None or options.window_width is None):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, 'custom window requires window_center and window_width')
+    if not Frames.valid(options.frames):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f'{options.frames} is not a valid frames selector')
+    return {name: getattr(options, name) for name in Options.__fields__}
+
+
+def __convert_response(result: dict, stream: bool = False):
+    # Multiple frames are sent one after another as separate JSON lines.
+    if 'frames' in result:
+        return responses.StreamingResponse(__stream_frames(result), media_type=FRAMES_MEDIA_TYPE)
+    # The raw photo is base64 encoded chunk by chunk while it is sent, the whole response body is never built.
+    if stream:
+        head, tail = __stream_envelope(result)
+        encoded_size = 4 * ((len(result.get('photo') or b'') + 2) // 3)
+        return responses.StreamingResponse(
+            __stream_photo(head, result.get('photo'), tail),
+            media_type='application/json',
+            headers={'Content-Length': str(len(head) + encoded_size + len(tail))}
+        )
+    return Response(
+        photo=result.get('photo'),
+        attributes=result['attributes']
+    )
+
+
+def __job(job_id: str) -> Job:
+    if (job := jobs.get(job_id)) is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, 'Job does not exist or has expired')
+    return job
+
+
+def __job_response(job: Job) -> JobResponse:
+    return JobResponse(id=job.id, status=job.status, priority=job.priority, detail=job.detail)
 
 
-def __convert(data: bytes) -> bytes:
+async def __run_jobs():
+    # Runner takes the most important pending job, until there are no pending jobs left.
     try:
-        return Converter.convert(io.BytesIO(data))
-    except Exception as e:
-        logging.error(f'Conversion error: {e}')
-        raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, 'Internal conversion error occurred')
+        while (job := jobs.next()) is not None:
+            try:
+                jobs.finish(job, await __convert_request(job.request, job.request.attributes_only))
+            except HTTPException as e:
+                jobs.fail(job, e.status_code, e.detail)
+            except Exception as e:
+                logging.error(f'Job error: {e}')
+                jobs.fail(job, status.HTTP_500_INTERNAL_SERVER_ERROR, 'Internal error occurred')
+    finally:
+        jobs.runners -= 1
+
+
+def __attributes(names: typing.Optional[typing.List[str]]) -> typing.Optional[typing.List[str]]:
+    from attributes.reader import AttributesReader
+    for name in names or ():
+        if not AttributesReader.supports(name):
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, f'{name} attribute is not supported')
+    return names
+
+
+async def __convert_request(req: Request, attributes_only: bool = False, encode_photo: bool = True) -> dict:
+    options = __options(req)
+    attributes = __attributes(req.attributes)
+    metrics.requests_total.inc(
+        endpoint='attributes' if attributes_only else 'convert',
+        compression=__metric_label(req.compression, Decompressor.allowed_compression_methods)
+    )
+    # Resubmitted studies are served from the cache.
+    key = ResultCache.key(
+        req.image,
+        req.compression,
+        req.encoded,
+        json.dumps(options, sort_keys=True),
+        json.dumps(attributes),
+        attributes_only,
+        encode_photo
+    )
+    if (result := await cache.get(key)) is not None:
+        return result
+    # Duplicates arriving while the conversion runs share its result instead of converting again.
+    return await single_flight.run(
+        key, lambda: __convert_image(key, req, options, attributes, attributes_only, encode_photo)
+    )
 
 
-def __encode(data: bytes) -> bytes:
+async def __convert_image(
+        key: str,
+        req: Request,
+        options: dict,
+        attributes: list,
+        attributes_only: bool,
+        encode_photo: bool = True
+) -> dict:
+    # The whole conversion pipeline is CPU-bound, so it is handed to the executor.
+    pipeline = __pipeline()
+    if attributes_only:
+        result = await __execute_payload(pipeline.run_attributes, req.image, req.compression, req.encoded, attributes)
+    else:
+        async with __admitted(req.image, req.compression, req.encoded):
+            result = await __execute_payload(
+                pipeline.run, req.image, req.compression, req.encoded, options, attributes, encode_photo
+            )
+    await cache.put(key, result)
+    return result
+
+
+async def __convert_binary(key: str, data: bytes, content_encoding: str, options: dict) -> dict:
+    async with __admitted(data, content_encoding, True):
+        result = await __execute_payload(__pipeline().run_binary, data, content_encoding, options)
+    await cache.put(key, result)
+    return result
+
+
+@contextlib.asynccontextmanager
+async def __admitted(data: typing.Union[str, bytes], method: str, encoded: bool):
+    # Memory is reserved first accordingly to the payload size, refined once the header is read.
     try:
-        return base64.b64encode(data)
+        reserved = await admission.acquire(MemoryEstimate.from_payload(len(data), Decompressor.max_output_size))
+    except AdmissionError:
+        __reject_admission()
+    try:
+        # Peek is bounded by the payload reservation held meanwhile, it runs off the event loop.
+        if admission.enabled and (cost := await asyncio.to_thread(__header_cost, data, method, encoded)):
+            try:
+                reserved = await admission.resize(reserved, cost)
+            except AdmissionError:
+                __reject_admission()
+        yield
+    finally:
+        admission.release(reserved)
+
+
+def __header_cost(data: typing.Union[str, bytes], method: str, encoded: bool) -> typing.Optional[int]:
+    from parsing.parser import Parser
+    try:
+        header = Decompressor.peek(data, method, encoded, HEADER_PEEK_SIZE)
+        return MemoryEstimate.from_header(Parser.parse_header(header))
+    except Exception:
+        # Header not fitting the peeked data is not an error, the payload estimate is used then.
+        return None
+
+
+def __reject_admission():
+    metrics.errors_total.inc(error=AdmissionError.__name__, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    raise HTTPException(
+        status.HTTP_503_SERVICE_UNAVAILABLE,
+        'Service is overloaded, try again later',
+        headers={'Retry-After': str(RETRY_AFTER_SECONDS)}
+    )
+
+
+async def __stream_batch(items: typing.List[Request], ordered: bool) -> typing.AsyncIterator[str]:
+    # Items of a single batch must not occupy the whole executor queue.
+    semaphore = asyncio.Semaphore(executor.workers or os.cpu_count() or 1)
+
+    async def convert_item(index: int, item: Request) -> dict:
+        async with semaphore:
+            try:
+                result = await __convert_request(item, item.attributes_only)
+                response = {
+                    'index': index,
+                    'status': status.HTTP_200_OK,
+                    'photo': result['photo'].decode() if 'photo' in result else None,
+                    'attributes': result['attributes']
+                }
+                if 'frames' in result:
+                    response['frames'] = [
+                        {'frame': frame, 'photo': photo.decode()} for frame, photo in result['frames']
+                    ]
+                return response
+            except HTTPException as e:
+                return {'index': index, 'status': e.status_code, 'detail': e.detail}
+            except Exception as e:
+                logging.error(f'Batch item error: {e}')
+                return {
+                    'index': index,
+                    'status': status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    'detail': 'Internal error occurred'
+                }
+
+    tasks = [asyncio.ensure_future(convert_item(index, item)) for index, item in enumerate(items)]
+    try:
+        for task in (tasks if ordered else asyncio.as_completed(tasks)):
+            yield json.dumps(await task) + '\n'
+    finally:
+        # The client may disconnect before all the items were sent.
+        for task in tasks:
+            task.cancel()
+
+
+async def __convert_archive(req: HTTPRequest, reader: ArchiveReader, writer: ArchiveWriter, options: dict) -> dict:
+    # Next member is extracted only when the conversion slot is free, so the memory is bounded by
+    # the number of slots times the largest member, whatever the number of files in the archive is.
+    semaphore = asyncio.Semaphore(executor.workers or os.cpu_count() or 1)
+    extension = __extension(options['format'])
+    files, tasks = [], set()
+
+    async def convert_member(entry: dict, data: bytes):
+        try:
+            key = ResultCache.key(data, 'binary', 'identity', json.dumps(options, sort_keys=True))
+            if (result := await cache.get(key)) is None:
+                result = await single_flight.run(key, lambda: __convert_binary(key, data, 'identity', options))
+            # Converted files are written as soon as they are ready, so they are not kept in memory.
+            # Writing may reach the disk, so it runs in the thread and the writer serialises the writes.
+            entry['files'] = [
+                await asyncio.to_thread(writer.add, __archive_name(entry['name'], extension, frame), photo)
+                for frame, photo in result.get('frames', [(None, result.get('photo'))])
+            ]
+            entry.update(status=status.HTTP_200_OK, attributes=result['attributes'])
+        except HTTPException as e:
+            entry.update(status=e.status_code, detail=e.detail)
+        except Exception as e:
+            logging.error(f'Archive member error: {e}')
+            entry.update(status=status.HTTP_500_INTERNAL_SERVER_ERROR, detail='Internal error occurred')
+        finally:
+            semaphore.release()
+
+    async def submit(member: Member):
+        entry = {'name': member.name}
+        files.append(entry)
+        if member.error is not None:
+            too_large = isinstance(member.error, MemberTooLargeError)
+            entry.update(
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE if too_large else status.HTTP_400_BAD_REQUEST,
+                detail=str(member.error)
+            )
+            return
+        await semaphore.acquire()
+        task = asyncio.ensure_future(convert_member(entry, member.data))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    try:
+        async for chunk in req.stream():
+            for member in reader.feed(chunk):
+                await submit(member)
+        for member in reader.close():
+            await submit(member)
+        await asyncio.gather(*tasks)
+    finally:
+        # Reading the archive may fail while some members are still converted.
+        for task in list(tasks):
+            task.cancel()
+    return {'files': files}
+
+
+def __archive_name(name: str, extension: str, frame: typing.Optional[int]) -> str:
+    stem = DICOM_SUFFIX_PATTERN.sub('', name)
+    return f'{stem}.{extension}' if frame is None else f'{stem}/{frame}.{extension}'
+
+
+def __stream_frames(result: dict) -> typing.Iterator[str]:
+    yield json.dumps({'attributes': result['attributes']}) + '\n'
+    for frame, photo in result['frames']:
+        yield json.dumps({'frame': frame, 'photo': photo.decode()}) + '\n'
+
+
+def __stream_envelope(result: dict) -> typing.Tuple[bytes, bytes]:
+    # JSON of the same shape as the Response, with the attributes sent before the photo.
+    head = b'{"attributes": ' + json.dumps(result['attributes']).encode() + b', "photo": '
+    return (head + b'"', b'"}') if 'photo' in result else (head + b'null', b'}')
+
+
+def __stream_photo(head: bytes, photo: typing.Optional[bytes], tail: bytes) -> typing.Iterator[bytes]:
+    yield head
+    view = memoryview(photo or b'')
+    # Slices of a multiple of 3 bytes are encoded independently, every one into STREAM_CHUNK_SIZE characters.
+    slice_size = STREAM_CHUNK_SIZE // 4 * 3
+    for start in range(0, len(view), slice_size):
+        yield base64.b64encode(view[start:start + slice_size])
+    yield tail
+
+
+def __stream_frame_parts(result: dict, media_type: str) -> typing.Iterator[bytes]:
+    for frame, photo in result['frames']:
+        yield (
+            f'--{FRAMES_BOUNDARY}\r\n'
+            f'Content-Type: {media_type}\r\n'
+            f'X-DICOM-Frame: {frame}\r\n\r\n'
+        ).encode() + photo + b'\r\n'
+    yield f'--{FRAMES_BOUNDARY}--\r\n'.encode()
+
+
+async def __execute_payload(fn, payload: typing.Union[str, bytes], *args):
+    if transport is None or executor.mode != 'process':
+        return await __execute(fn, payload, *args)
+    # Only the descriptors of the segments are sent to the worker, whatever the payload size is.
+    try:
+        source, target = transport.acquire(payload)
     except Exception as e:
-        logging.error(f'Encoding error: {e}')
-        raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, 'Internal error while encoding the result occurred')
+        # Payloads not fitting the segments (non-ASCII image, exhausted shared memory) are pickled instead.
+        logging.warning(f'Shared memory transport error: {e}')
+        return await __execute(fn, payload, *args)
+    try:
+        result = await __execute(run_in_segments, fn, source, target, *args)
+    except BaseException as e:
+        # The worker may still use the segments after the timeout, the crash or the cancellation,
+        # so they are never reused then. Otherwise the job is over and they go back to the pool.
+        if isinstance(e, (BrokenProcessPool, asyncio.CancelledError)) or isinstance(e.__context__, JobTimeoutError):
+            transport.discard(source, target)
+        else:
+            transport.release(source, target)
+        raise
+    result = transport.unpack(result, target)
+    transport.release(source, target)
+    return result
 
 
-def __read_attributes(data: bytes) -> dict:
+async def __execute(fn, *args):
+    metrics.requests_in_flight.inc()
     try:
-        return AttributesReader.read_attributes(io.BytesIO(data))
+        result = await executor.submit(fn, *args)
+    except PipelineError as e:
+        metrics.errors_total.inc(error=type(e).__name__, status=e.status_code)
+        raise HTTPException(e.status_code, e.detail)
+    except QueueFullError as e:
+        metrics.errors_total.inc(error=type(e).__name__, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        raise HTTPException(
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            'Service is overloaded, try again later',
+            headers={'Retry-After': str(RETRY_AFTER_SECONDS)}
+        )
+    except JobTimeoutError as e:
+        metrics.errors_total.inc(error=type(e).__name__, status=status.HTTP_504_GATEWAY_TIMEOUT)
+        raise HTTPException(status.HTTP_504_GATEWAY_TIMEOUT, 'Conversion did not finish in time')
     except Exception as e:
-        logging.error(f'Reading attributes error: {e}')
-        raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, 'Error while reading DICOM attributes occurred')
+        metrics.errors_total.inc(error=type(e).__name__, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        raise
+    finally:
+        metrics.requests_in_flight.dec()
+    # Stage measurements are recorded here, since the pipeline may run inside a worker process.
+    for stage, duration, input_size, output_size, allocated in result.pop('stages', ()):
+        metrics.stage_duration.observe(duration, stage=stage)
+        metrics.stage_input_bytes.observe(input_size, stage=stage)
+        metrics.stage_output_bytes.observe(output_size, stage=stage)
+        if allocated is not None:
+            metrics.stage_allocated_bytes.observe(allocated, stage=stage)
+            logging.info(f'Stage {stage}: {input_size} bytes in, {output_size} bytes out, {allocated} bytes allocated')
+    return result
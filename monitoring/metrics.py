@@ -0,0 +1,128 @@
+import bisect
+import typing
+
+
+class Metric:
+    """
+    Base class of the metrics exposed in the Prometheus text format.
+
+    Metric values are kept per combination of label values, the labels
+    are passed as keyword arguments when the metric is updated. Metric backed
+    by the function reports the value of the function at the time of scraping.
+    """
+    type = 'untyped'
+
+    def __init__(self, name: str, description: str, function: typing.Callable[[], float] = None):
+        self.name = name
+        self.description = description
+        self.function = function
+        self.values = {}
+
+    def render(self) -> typing.List[str]:
+        if self.function is not None:
+            self.values = {(): self.function()}
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.type}']
+        for labels, value in self.values.items():
+            lines.append(f'{self.name}{Metric.format_labels(labels)} {value}')
+        return lines
+
+    @staticmethod
+    def format_labels(labels: tuple) -> str:
+        if not labels:
+            return ''
+        escaped = (f'{name}="{Metric.escape(str(value))}"' for name, value in labels)
+        return '{' + ','.join(escaped) + '}'
+
+    @staticmethod
+    def escape(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def inc(self, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + value
+
+    def dec(self, value: float = 1, **labels):
+        self.inc(-value, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, description: str, buckets: typing.Sequence[float]):
+        super().__init__(name, description)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        if (state := self.values.get(key)) is None:
+            # Bucket counts are not cumulative here, they are accumulated when rendered.
+            state = self.values[key] = [[0] * (len(self.buckets) + 1), 0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self) -> typing.List[str]:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.type}']
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip([*self.buckets, '+Inf'], counts):
+                cumulative += bucket_count
+                bucket_labels = Metric.format_labels((*labels, ('le', bound)))
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{self.name}_sum{Metric.format_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{Metric.format_labels(labels)} {count}')
+        return lines
+
+
+class Registry:
+    """
+    Class collecting the metrics of the service.
+    """
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(line for metric in self.metrics for line in metric.render()) + '\n'
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = tuple(1024 * 4 ** exponent for exponent in range(11))
+
+registry = Registry()
+stage_duration = registry.register(Histogram(
+    'dicom_stage_duration_seconds', 'Duration of the conversion pipeline stages.', DURATION_BUCKETS
+))
+stage_input_bytes = registry.register(Histogram(
+    'dicom_stage_input_bytes', 'Size of the conversion pipeline stages input.', SIZE_BUCKETS
+))
+stage_output_bytes = registry.register(Histogram(
+    'dicom_stage_output_bytes', 'Size of the conversion pipeline stages output.', SIZE_BUCKETS
+))
+stage_allocated_bytes = registry.register(Histogram(
+    'dicom_stage_allocated_bytes', 'Peak memory allocated by the conversion pipeline stages (debug mode).', SIZE_BUCKETS
+))
+requests_total = registry.register(Counter(
+    'dicom_requests_total', 'Number of conversion requests per endpoint and compression method.'
+))
+errors_total = registry.register(Counter(
+    'dicom_errors_total', 'Number of failed conversions per error class.'
+))
+requests_in_flight = registry.register(Gauge(
+    'dicom_requests_in_flight', 'Number of conversions being processed.'
+))
@@ -0,0 +1,103 @@
+import io
+import typing
+import pydicom
+
+
+class BufferReader(io.RawIOBase):
+    """
+    Read-only file-like view of the bytes buffer.
+
+    Unlike io.BytesIO, it never copies the whole buffer (io.BytesIO copies everything but bytes),
+    only the slices actually read are copied, so the decompressed DICOM is parsed in place.
+    """
+    def __init__(self, data: typing.Union[bytes, bytearray, memoryview]):
+        super().__init__()
+        self.__view = memoryview(data).toreadonly().cast('B')
+        self.__position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self.__view) if size is None or size < 0 else min(self.__position + size, len(self.__view))
+        data = bytes(self.__view[self.__position:end])
+        self.__position = max(self.__position, end)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self.__position = offset
+        elif whence == io.SEEK_CUR:
+            self.__position += offset
+        elif whence == io.SEEK_END:
+            self.__position = len(self.__view) + offset
+        else:
+            raise ValueError(f'{whence} whence is not supported')
+        if self.__position < 0:
+            raise ValueError('Negative seek position')
+        return self.__position
+
+    def tell(self) -> int:
+        return self.__position
+
+
+class Parser:
+    """
+    Class responsible for parsing the decompressed DICOM bytes.
+
+    The parsed dataset is shared by all the following pipeline stages,
+    so the DICOM file is parsed only once per request. The bytes are read
+    through the read-only view, so the decompressed buffer is not copied.
+    """
+    # Little endian (7FE0,0010) Pixel Data tag, the header elements precede it.
+    pixel_data_tag = b'\xe0\x7f\x10\x00'
+
+    @staticmethod
+    def parse(dcm_decompressed_bytes: typing.Union[bytes, bytearray, memoryview]) -> pydicom.Dataset:
+        return pydicom.dcmread(BufferReader(dcm_decompressed_bytes), force=True)
+
+    @staticmethod
+    def parse_header(
+            dcm_decompressed_bytes: typing.Union[bytes, bytearray, memoryview],
+            tags: typing.List[str] = None
+    ) -> pydicom.Dataset:
+        """
+        Parse only the header of DICOM, the pixel data is not read.
+
+        :param dcm_decompressed_bytes: DICOM bytes.
+        :param tags: DICOM keywords of the elements to read, all the header elements by default.
+        :return: dataset without the pixel data.
+        """
+        return pydicom.dcmread(
+            BufferReader(dcm_decompressed_bytes),
+            force=True,
+            stop_before_pixels=True,
+            specific_tags=tags
+        )
+
+    @staticmethod
+    def write(dataset: pydicom.Dataset) -> bytes:
+        """
+        Write the dataset as DICOM file bytes, encoded accordingly to its transfer syntax.
+
+        :param dataset: dataset with the file meta information.
+        :return: DICOM bytes.
+        """
+        buffer = io.BytesIO()
+        try:
+            pydicom.dcmwrite(buffer, dataset, enforce_file_format=True)
+        except TypeError:
+            # Older pydicom derives the encoding from the dataset attributes.
+            buffer = io.BytesIO()
+            dataset.is_little_endian = True
+            dataset.is_implicit_VR = dataset.file_meta.TransferSyntaxUID == pydicom.uid.ImplicitVRLittleEndian
+            pydicom.dcmwrite(buffer, dataset, write_like_original=False)
+        return buffer.getvalue()
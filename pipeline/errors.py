@@ -0,0 +1,12 @@
+class PipelineError(Exception):
+    """
+    Error raised by the conversion pipeline stages.
+
+    It carries the HTTP status code and the message which should be returned
+    to the client. The error must stay picklable, since the pipeline may
+    be executed inside a worker process.
+    """
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
@@ -0,0 +1,244 @@
+import time
+import base64
+import typing
+import logging
+import tracemalloc
+
+import pydicom
+from fastapi import status
+from parsing.parser import Parser
+from conversion.converter import Converter
+from conversion.frames import Frames, FrameSelectionError
+from compression.decompressor import Decompressor, OutputLimitError
+from compression.methods.lzw import LZString
+from attributes.reader import AttributesReader
+from pipeline.errors import PipelineError
+
+# Debug mode measuring the peak memory allocated by every stage, it slows the stages down.
+trace_allocations = False
+
+
+def run(
+        image: str,
+        compression: str,
+        encoded: bool,
+        options: dict = None,
+        attributes: list = None,
+        encode_photo: bool = True
+) -> dict:
+    """
+    Execute the whole conversion pipeline for the submitted image.
+
+    The function is CPU-bound and self-contained, so it can be executed
+    either inline or inside a worker process.
+
+    :param image: compressed image data.
+    :param compression: name of the compression method used on the image.
+    :param encoded: whether the image was base64 encoded before compression.
+    :param options: keyword options of the conversion.
+    :param attributes: names of the attributes to read, the registered ones by default.
+    :param encode_photo: whether the single photo is base64 encoded, the streamed one is encoded while sent.
+    :return: dictionary with the encoded photo (or frames), read DICOM attributes and stage measurements.
+    """
+    stages = []
+    decompressed_data = __measure(stages, 'decompress', len(image), __decompress, image, compression, encoded)
+    result = __convert_dicom(decompressed_data, options or {}, attributes, stages)
+    if 'photo' in result:
+        if encode_photo:
+            result['photo'] = __measure(stages, 'encode', len(result['photo']), __encode, result['photo'])
+    else:
+        # Frames are encoded in place, every raw frame is released as soon as it is encoded.
+        frames = result['frames']
+        for position, (index, photo) in enumerate(frames):
+            frames[position] = index, __measure(stages, 'encode', len(photo), __encode, photo)
+    return result
+
+
+def run_binary(data: bytes, content_encoding: str, options: dict = None, attributes: list = None) -> dict:
+    """
+    Execute the conversion pipeline for the DICOM submitted as raw bytes.
+
+    :param data: DICOM bytes, optionally compressed with the content encoding.
+    :param content_encoding: name of the HTTP content encoding applied to the data.
+    :param options: keyword options of the conversion.
+    :param attributes: names of the attributes to read, the registered ones by default.
+    :return: dictionary with the photo (or frames) bytes, read DICOM attributes and stage measurements.
+    """
+    stages = []
+    decoded_data = __measure(stages, 'decode_content', len(data), __decode_content, data, content_encoding)
+    return __convert_dicom(decoded_data, options or {}, attributes, stages)
+
+
+def run_attributes(image: str, compression: str, encoded: bool, attributes: list = None) -> dict:
+    """
+    Execute the pipeline reading only the attributes of the submitted image.
+
+    Only the elements necessary to read the attributes are parsed,
+    the pixel data is neither decoded nor converted. The image is decompressed
+    only up to the pixel data, the whole image only when it has no pixel data.
+
+    :param image: compressed image data.
+    :param compression: name of the compression method used on the image.
+    :param encoded: whether the image was base64 encoded before compression.
+    :param attributes: names of the attributes to read, the registered ones by default.
+    :return: dictionary with read DICOM attributes and stage measurements.
+    """
+    stages = []
+    decompressed_data = __measure(
+        stages, 'decompress', len(image), __decompress, image, compression, encoded, Parser.pixel_data_tag
+    )
+    dataset = __measure(stages, 'parse_header', len(decompressed_data), __parse_header, decompressed_data, attributes)
+    return {
+        'attributes': __measure(
+            stages, 'read_attributes', len(decompressed_data), __read_attributes, dataset, attributes
+        ),
+        'stages': stages
+    }
+
+
+def warm_up() -> float:
+    """
+    Run the tiny synthetic DICOM through the whole pipeline.
+
+    It imports the modules loaded on first use (pixel data handlers, Pillow plugins)
+    and fills the caches, so the first real request is served with the steady-state latency.
+
+    :return: duration of the warm-up in seconds.
+    """
+    start = time.perf_counter()
+    image = LZString.compressToBase64(base64.b64encode(__synthetic_dicom()).decode())
+    run(image, 'lz', True)
+    return time.perf_counter() - start
+
+
+def __synthetic_dicom() -> bytes:
+    dataset = pydicom.Dataset()
+    dataset.file_meta = pydicom.dataset.FileMetaDataset()
+    dataset.file_meta.TransferSyntaxUID = pydicom.uid.ExplicitVRLittleEndian
+    dataset.file_meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.7'
+    dataset.file_meta.MediaStorageSOPInstanceUID = pydicom.uid.generate_uid()
+    dataset.Rows = dataset.Columns = 8
+    dataset.PixelSpacing = [1, 1]
+    dataset.SamplesPerPixel = 1
+    dataset.PhotometricInterpretation = 'MONOCHROME2'
+    dataset.BitsAllocated = dataset.BitsStored = 16
+    dataset.HighBit = 15
+    dataset.PixelRepresentation = 0
+    dataset.PixelData = bytes(range(128))
+    return Parser.write(dataset)
+
+
+def __convert_dicom(data: bytes, options: dict, attributes: typing.Optional[list], stages: list) -> dict:
+    # DICOM is parsed once and the dataset is shared by the following stages.
+    dataset = __measure(stages, 'parse', len(data), __parse, data)
+    options = dict(options)
+    selector = options.pop('frames', None)
+    # Single frame results in the photo, multiple frames result in the list of (index, photo) pairs.
+    converted_data = __measure(stages, 'convert', len(data), __convert, dataset, selector, options)
+    # Read the pixel spacing attribute, necessary by some micro-services.
+    attributes = __measure(stages, 'read_attributes', len(data), __read_attributes, dataset, attributes)
+    return {
+        'photo' if Frames.is_single(selector) else 'frames': converted_data,
+        'attributes': attributes,
+        'stages': stages
+    }
+
+
+def __measure(stages: list, stage: str, input_size: int, fn: typing.Callable, *args) -> typing.Any:
+    # Measurements are returned with the result, since the stages may run inside a worker process.
+    if trace_allocations:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        traced_before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = fn(*args)
+    duration = time.perf_counter() - start
+    # Allocated bytes are the peak of the memory traced during the stage above the memory traced before it.
+    allocated = tracemalloc.get_traced_memory()[1] - traced_before if trace_allocations else None
+    if isinstance(result, (bytes, bytearray, memoryview)):
+        output_size = len(result)
+    elif isinstance(result, list):
+        output_size = sum(len(photo) for _, photo in result)
+    else:
+        output_size = 0
+    stages.append((stage, duration, input_size, output_size, allocated))
+    return result
+
+
+def __decompress(image: str, compression: str, encoded: bool, marker: bytes = None) -> bytearray:
+    try:
+        if marker is not None:
+            return Decompressor.decompress_until(image, compression, encoded, marker)
+        return Decompressor.decompress(image, compression, encoded)
+    except NotImplementedError:
+        logging.error(f'Decompress: {compression} compression is not supported')
+        raise PipelineError(status.HTTP_400_BAD_REQUEST, f'{compression} compression is not supported')
+    except OutputLimitError as e:
+        logging.error(f'Decompress: {e}')
+        raise PipelineError(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, 'Decompressed image is too large')
+    except Exception as e:
+        logging.error(f'Decompress error: {e}')
+        raise PipelineError(status.HTTP_500_INTERNAL_SERVER_ERROR, 'Internal decompression error occurred')
+
+
+def __decode_content(data: bytes, content_encoding: str) -> bytes:
+    try:
+        return Decompressor.decode_content(data, content_encoding)
+    except NotImplementedError:
+        logging.error(f'Decode content: {content_encoding} content encoding is not supported')
+        raise PipelineError(
+            status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, f'{content_encoding} content encoding is not supported'
+        )
+    except OutputLimitError as e:
+        logging.error(f'Decode content: {e}')
+        raise PipelineError(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, 'Decoded request body is too large')
+    except Exception as e:
+        logging.error(f'Decode content error: {e}')
+        raise PipelineError(status.HTTP_400_BAD_REQUEST, 'Request body could not be decoded')
+
+
+def __parse(data: bytes) -> pydicom.Dataset:
+    try:
+        return Parser.parse(data)
+    except Exception as e:
+        logging.error(f'Parsing error: {e}')
+        raise PipelineError(status.HTTP_500_INTERNAL_SERVER_ERROR, 'Error while parsing DICOM data occurred')
+
+
+def __parse_header(data: bytes, names: typing.Optional[list]) -> pydicom.Dataset:
+    try:
+        return Parser.parse_header(data, AttributesReader.tags(names))
+    except Exception as e:
+        logging.error(f'Parsing header error: {e}')
+        raise PipelineError(status.HTTP_500_INTERNAL_SERVER_ERROR, 'Error while parsing DICOM data occurred')
+
+
+def __convert(dataset: pydicom.Dataset, selector: typing.Optional[str], options: dict) -> typing.Union[bytes, list]:
+    try:
+        frames = Frames.select(selector, Frames.count(dataset))
+        if Frames.is_single(selector):
+            return Converter.convert(dataset, frames[0], **options)
+        return list(Converter.convert_frames(dataset, frames, **options))
+    except FrameSelectionError as e:
+        logging.error(f'Conversion: {e}')
+        raise PipelineError(status.HTTP_400_BAD_REQUEST, str(e))
+    except Exception as e:
+        logging.error(f'Conversion error: {e}')
+        raise PipelineError(status.HTTP_500_INTERNAL_SERVER_ERROR, 'Internal conversion error occurred')
+
+
+def __encode(data: bytes) -> bytes:
+    try:
+        return base64.b64encode(data)
+    except Exception as e:
+        logging.error(f'Encoding error: {e}')
+        raise PipelineError(status.HTTP_500_INTERNAL_SERVER_ERROR, 'Internal error while encoding the result occurred')
+
+
+def __read_attributes(dataset: pydicom.Dataset, names: typing.Optional[list]) -> dict:
+    try:
+        return AttributesReader.read_attributes(dataset, names)
+    except Exception as e:
+        logging.error(f'Reading attributes error: {e}')
+        raise PipelineError(status.HTTP_500_INTERNAL_SERVER_ERROR, 'Error while reading DICOM attributes occurred')
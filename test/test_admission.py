@@ -0,0 +1,63 @@
+import asyncio
+import pydicom
+import pytest
+import tracemalloc
+
+from compression.decompressor import Decompressor
+from execution.admission import AdmissionController, AdmissionError, MemoryEstimate
+
+
+def test_memory_estimate_from_header():
+    dataset = pydicom.Dataset()
+    dataset.Rows, dataset.Columns, dataset.BitsAllocated, dataset.NumberOfFrames = 10, 20, 16, 3
+
+    assert MemoryEstimate.from_header(dataset) == 2 * 200 * 2 * 3 + 200 * 12
+    assert MemoryEstimate.from_header(pydicom.Dataset()) is None
+    assert MemoryEstimate.from_payload(100, 200) == 400
+
+
+def test_admission_waits_for_released_memory():
+    controller = AdmissionController(budget=100, timeout=1)
+
+    async def run():
+        reserved = await controller.acquire(80)
+        waiting = asyncio.ensure_future(controller.acquire(50))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        controller.release(reserved)
+        return await waiting
+
+    assert asyncio.run(run()) == 50
+    assert controller.used == 50
+
+
+def test_admission_rejects_after_timeout():
+    controller = AdmissionController(budget=100, timeout=0.01)
+
+    async def run():
+        reserved = await controller.acquire(60)
+        # Refined cost larger than the budget is admitted only when nothing else runs.
+        assert await controller.resize(reserved, 150) == 150
+        await controller.acquire(10)
+
+    with pytest.raises(AdmissionError):
+        asyncio.run(run())
+    assert controller.used == 150
+    assert controller.rejected == 1
+
+
+def test_header_peek_fits_payload_estimate():
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = f.read()
+    # The first peek imports NumPy, it is not part of the peek memory.
+    Decompressor.peek(data, 'lz', True, 64 * 1024)
+
+    tracemalloc.start()
+    try:
+        header = Decompressor.peek(data, 'lz', True, 64 * 1024)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert len(header) >= 64 * 1024
+    assert peak < MemoryEstimate.from_payload(len(data), Decompressor.max_output_size)
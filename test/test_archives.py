@@ -0,0 +1,140 @@
+import io
+import tarfile
+import zipfile
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+from archives.reader import ArchiveReader, ArchiveError, MemberError, MemberTooLargeError
+from archives.writer import ArchiveWriter
+
+files = {'study/1.dcm': b'first' * 100, 'study/2.dcm': b'second' * 1000, 'empty.dcm': b''}
+
+
+class UnseekableStream(io.RawIOBase):
+    """
+    Stream without seeking, ZIP written into it has the data descriptors.
+    """
+    def __init__(self):
+        super().__init__()
+        self.buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        return len(data)
+
+
+def zip_archive(compression: int, stream: bool = False) -> bytes:
+    target = UnseekableStream() if stream else io.BytesIO()
+    with zipfile.ZipFile(target, 'w', compression) as archive:
+        # Directory members are skipped by the reader.
+        archive.writestr('study/', b'')
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return bytes(target.buffer) if stream else target.getvalue()
+
+
+def tar_archive(tar_format: int = tarfile.GNU_FORMAT, names: dict = None) -> bytes:
+    target = io.BytesIO()
+    with tarfile.open(fileobj=target, mode='w', format=tar_format) as archive:
+        for name, data in (names or files).items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return target.getvalue()
+
+
+def read(reader: ArchiveReader, archive: bytes, chunk_size: int) -> list:
+    members = []
+    for start in range(0, len(archive), chunk_size):
+        members += reader.feed(archive[start:start + chunk_size])
+    return members + list(reader.close())
+
+
+@pytest.mark.parametrize('archive_format, archive', [
+    ('zip', zip_archive(zipfile.ZIP_STORED)),
+    ('zip', zip_archive(zipfile.ZIP_DEFLATED)),
+    ('zip', zip_archive(zipfile.ZIP_DEFLATED, stream=True)),
+    ('tar', tar_archive()),
+    ('tar', tar_archive(tarfile.PAX_FORMAT))
+])
+@pytest.mark.parametrize('chunk_size', [7, 1 << 20])
+def test_members_are_extracted_incrementally(archive_format, archive, chunk_size):
+    members = read(ArchiveReader(archive_format, 1 << 20), archive, chunk_size)
+
+    assert {member.name: member.data for member in members} == files
+    assert all(member.error is None for member in members)
+
+
+def test_long_tar_names_are_read():
+    name = 'study/' + 'series' * 30 + '/1.dcm'
+
+    for tar_format in (tarfile.GNU_FORMAT, tarfile.PAX_FORMAT):
+        members = read(ArchiveReader('tar', 1 << 20), tar_archive(tar_format, {name: b'data'}), 100)
+
+        assert [(member.name, member.data) for member in members] == [(name, b'data')]
+
+
+@pytest.mark.parametrize('archive_format, archive', [
+    ('zip', zip_archive(zipfile.ZIP_STORED)),
+    ('zip', zip_archive(zipfile.ZIP_DEFLATED, stream=True)),
+    ('tar', tar_archive())
+])
+def test_too_large_members_are_skipped(archive_format, archive):
+    members = read(ArchiveReader(archive_format, 1000), archive, 64)
+
+    assert [member.name for member in members] == list(files)
+    assert isinstance(members[1].error, MemberTooLargeError)
+    assert members[1].data is None
+    assert members[0].data == files['study/1.dcm']
+
+
+def test_corrupted_member_is_reported():
+    archive = bytearray(zip_archive(zipfile.ZIP_STORED))
+    offset = archive.index(b'first')
+    archive[offset] = ord('F')
+
+    members = read(ArchiveReader('zip', 1 << 20), bytes(archive), 1 << 20)
+
+    assert type(members[0].error) is MemberError
+    assert members[1].data == files['study/2.dcm']
+
+
+@pytest.mark.parametrize('archive_format, archive', [
+    ('zip', zip_archive(zipfile.ZIP_DEFLATED)[:200]),
+    ('tar', tar_archive()[:700]),
+    ('zip', b'not an archive'),
+    ('tar', b'x' * 512)
+])
+def test_invalid_archive(archive_format, archive):
+    with pytest.raises(ArchiveError):
+        read(ArchiveReader(archive_format, 1 << 20), archive, 64)
+
+
+@pytest.mark.parametrize('archive_format', ['zip', 'tar'])
+def test_writer_output_is_readable(archive_format):
+    writer = ArchiveWriter(archive_format, spool_size=16)
+    names = [writer.add(name, b'photo') for name in ('/study/1.png', '../study/1.png', 'study/./2.png')]
+    archive = b''.join(writer.stream(chunk_size=10))
+
+    members = read(ArchiveReader(archive_format, 1 << 20), archive, 64)
+
+    assert names == ['study/1.png', 'study/1-2.png', 'study/2.png']
+    assert [(member.name, member.data) for member in members] == [(name, b'photo') for name in names]
+
+
+@pytest.mark.parametrize('archive_format', ['zip', 'tar'])
+def test_writer_adds_files_from_threads(archive_format):
+    writer = ArchiveWriter(archive_format, spool_size=1024)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        names = list(pool.map(lambda index: writer.add('study/1.png', bytes([index]) * 1000), range(32)))
+    archive = b''.join(writer.stream(chunk_size=1 << 16))
+
+    members = read(ArchiveReader(archive_format, 1 << 20), archive, 1 << 16)
+
+    assert len(set(names)) == 32
+    assert {member.name: member.data for member in members} == {
+        name: bytes([index]) * 1000 for index, name in enumerate(names)
+    }
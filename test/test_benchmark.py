@@ -0,0 +1,64 @@
+import json
+import pytest
+
+from benchmark import corpus, load, stages
+from compression.decompressor import Decompressor
+from conversion.converter import Converter
+from parsing.parser import Parser
+
+
+@pytest.mark.parametrize('case', corpus.cases([32], [8, 16], [1, 2], list(corpus.SYNTAXES)), ids=lambda case: case.name)
+def test_corpus_images_are_converted(case):
+    data = corpus.generate(case)
+
+    assert Converter.convert(Parser.parse(data))
+
+
+@pytest.mark.parametrize('compression', corpus.COMPRESSIONS)
+def test_corpus_payload_round_trip(compression):
+    data = corpus.generate(corpus.Case(32, 16, 1, 'explicit'))
+
+    assert Decompressor.decompress(corpus.compress(data, compression), compression, True) == data
+
+
+def test_stages_report(tmp_path):
+    output = tmp_path / 'results.json'
+
+    stages.main([
+        '--sizes', '32', '--bits', '16', '--compressions', 'lz,zlib', '--repeat', '1',
+        '--corpus', str(tmp_path / 'corpus'), '--output', str(output)
+    ])
+    results = json.loads(output.read_text())['results']
+
+    assert {result['benchmark'] for result in results} == {
+        'lz_decompress', 'decompress', 'endpoint', 'parse', 'convert', 'read_attributes'
+    }
+    assert all(result['median_seconds'] > 0 and result['peak_memory_bytes'] > 0 for result in results)
+
+
+def test_load_replays_log(tmp_path):
+    data = corpus.generate(corpus.Case(32, 16, 1, 'explicit'))
+    log = tmp_path / 'requests.jsonl'
+    log.write_text('\n'.join([
+        json.dumps({'image': corpus.compress(data, 'zlib'), 'compression': 'zlib', 'encoded': True}),
+        json.dumps({'method': 'GET', 'path': '/'}),
+        json.dumps({'request_id': 'not a request'})
+    ]))
+    output = tmp_path / 'report.json'
+
+    load.main(['--log', str(log), '--requests', '6', '--concurrency', '2', '--output', str(output)])
+    report = json.loads(output.read_text())
+
+    assert report['requests'] == 6
+    assert report['skipped_lines'] == 1
+    assert report['statuses'] == {'200': 6}
+    assert report['latency_seconds']['p50'] <= report['latency_seconds']['p99']
+    assert report['server_rss']['peak_bytes'] > 0
+
+
+def test_percentile():
+    values = [float(value) for value in range(1, 101)]
+
+    assert load.percentile(values, 0.5) == 50
+    assert load.percentile(values, 0.99) == 99
+    assert load.percentile([], 0.5) is None
@@ -0,0 +1,90 @@
+import numpy as np
+import pydicom
+import pytest
+
+from benchmark import corpus
+from conversion.converter import Converter
+from conversion import frames
+from conversion.frames import Frames, FrameSelectionError
+from conversion.resizing import Resizing
+from conversion.windowing import Windowing
+from parsing.parser import Parser
+
+
+def reference_to_uint8(pixels: np.ndarray) -> np.ndarray:
+    pixels = pixels.astype(float)
+    return np.uint8((np.maximum(pixels, 0) / np.amax(pixels)) * 255)
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.int8, np.uint16, np.int16, np.int32, np.float32])
+def test_to_uint8_matches_float_scaling(dtype):
+    rng = np.random.default_rng(0)
+    info = np.iinfo(dtype) if np.issubdtype(dtype, np.integer) else np.finfo(dtype)
+    pixels = rng.integers(max(info.min, -4096), min(info.max, 4096), size=(64, 48), endpoint=True).astype(dtype)
+
+    assert np.array_equal(Converter.to_uint8(pixels), reference_to_uint8(pixels))
+
+
+def test_linear_window_lut_is_shared():
+    dataset = pydicom.Dataset()
+    dataset.RescaleSlope = 1
+    dataset.RescaleIntercept = -1024
+    pixels = np.array([[0, 1024, 2048]], dtype=np.uint16)
+
+    windowed = Windowing.apply(dataset, pixels, 'custom', 0, 1000)
+    windowed_again = Windowing.apply(dataset, pixels + 1, 'custom', 0, 1000)
+
+    assert windowed.tolist() == [[0, 127, 255]]
+    assert windowed_again.dtype == np.uint8
+    assert Windowing.lut.cache_info().hits >= 1
+
+
+def test_downsample_block_mean():
+    pixels = np.arange(36, dtype=np.uint16).reshape(6, 6)
+
+    reduced = Resizing.downsample(pixels, (3, 3))
+
+    assert reduced.dtype == np.uint16
+    assert reduced.tolist() == [[4, 6, 8], [16, 18, 20], [28, 30, 32]]
+
+
+def test_target_size_keeps_aspect_ratio():
+    assert Resizing.target_size(1000, 500, max_width=250) == (250, 125)
+    assert Resizing.target_size(1000, 500, max_height=100, scale=0.5) == (200, 100)
+    assert Resizing.target_size(1000, 500, max_width=2000) is None
+
+
+def test_frames_selector():
+    assert Frames.select(None, 5) == [0]
+    assert Frames.select('3', 5) == [3]
+    assert Frames.select('2:', 5) == [2, 3, 4]
+    assert Frames.select(':9', 3) == [0, 1, 2]
+    assert Frames.select('all', 2) == [0, 1]
+    with pytest.raises(FrameSelectionError):
+        Frames.select('5', 5)
+    with pytest.raises(FrameSelectionError):
+        Frames.select('1-2', 5)
+
+
+def test_native_frames_are_not_copied():
+    dataset = Parser.parse(corpus.generate(corpus.Case(16, 8, 3, 'explicit')))
+
+    frames = list(Frames.iterate(dataset, [0, 2]))
+
+    assert all(not frame.flags.writeable and frame.base is not None for frame in frames)
+    assert np.array_equal(frames[1], dataset.pixel_array[2])
+
+
+@pytest.mark.parametrize('syntax', ['rle', 'jpeg'])
+def test_encapsulated_frames_are_decoded_separately(monkeypatch, syntax):
+    data = corpus.generate(corpus.Case(16, 8, 4, syntax))
+    expected = Parser.parse(data).pixel_array[[1, 3]]
+    dataset = Parser.parse(data)
+    # Older pydicom has no per-frame decoding.
+    monkeypatch.setattr(frames, 'iter_pixels', None)
+
+    decoded = list(Frames.iterate(dataset, [1, 3]))
+
+    assert np.array_equal(np.stack(decoded), expected)
+    # The whole image was never decoded.
+    assert getattr(dataset, '_pixel_array', None) is None
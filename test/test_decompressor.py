@@ -0,0 +1,53 @@
+import bz2
+import gzip
+import lzma
+import zlib
+import base64
+import pytest
+
+from compression.decompressor import Decompressor, OutputLimitError
+from compression.methods.lzw import LZString
+
+
+dicom_bytes = bytes(range(256)) * 4096
+
+
+@pytest.mark.parametrize('method, compress', [
+    ('zlib', zlib.compress),
+    ('gzip', gzip.compress),
+    ('lzma', lzma.compress),
+    ('bz2', bz2.compress)
+])
+@pytest.mark.parametrize('encoded', [True, False])
+def test_codec_decompression(method, compress, encoded):
+    data = base64.b64encode(dicom_bytes) if encoded else dicom_bytes
+    compressed = base64.b64encode(compress(data)).decode()
+
+    assert Decompressor.decompress(compressed, method, encoded) == dicom_bytes
+
+
+def test_decompression_output_limit(monkeypatch):
+    monkeypatch.setattr(Decompressor, 'max_output_size', len(dicom_bytes) // 2)
+    compressed = base64.b64encode(zlib.compress(dicom_bytes)).decode()
+
+    with pytest.raises(OutputLimitError):
+        Decompressor.decompress(compressed, 'zlib', False)
+
+
+def test_truncated_codec_data():
+    compressed = base64.b64encode(zlib.compress(dicom_bytes)[:-16]).decode()
+
+    with pytest.raises(ValueError):
+        Decompressor.decompress(compressed, 'zlib', False)
+
+
+def test_decompression_until_marker():
+    data = b'header' * 50000 + b'MARKER' + b'pixels' * 500000
+    compressed = LZString.compressToBase64(base64.b64encode(data).decode())
+
+    prefix = Decompressor.decompress_until(compressed, 'lz', True, b'MARKER')
+
+    assert data.startswith(prefix)
+    assert b'MARKER' in prefix
+    assert len(prefix) < len(data) // 2
+    assert Decompressor.decompress_until(compressed, 'lz', True, b'MISSING') == data
@@ -0,0 +1,32 @@
+import random
+
+from compression.methods import lzw
+from compression.methods.lzw import LZString, decompressFromBase64
+
+
+def test_decoder_matches_reference_implementation():
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = f.read()
+
+    assert decompressFromBase64(data) == LZString.decompressFromBase64(data)
+
+
+def test_decoder_round_trip():
+    rng = random.Random(0)
+    for _ in range(100):
+        text = ''.join(chr(rng.choice([rng.randint(0, 255), rng.randint(256, 0xFFFF)])) for _ in range(rng.randint(1, 500)))
+        compressed = LZString.compressToBase64(text)
+
+        assert decompressFromBase64(compressed) == text == LZString.decompressFromBase64(compressed)
+
+
+def test_decoder_across_blocks(monkeypatch):
+    # Tiny blocks, so the codes are read across the block boundaries.
+    monkeypatch.setattr(lzw, '_BLOCK_SYMBOLS', 8)
+    rng = random.Random(1)
+    text = ''.join(chr(rng.randint(0, 300)) for _ in range(2000))
+    compressed = LZString.compressToBase64(text)
+
+    assert decompressFromBase64(compressed) == text
+    # Characters following the first invalid one are not read.
+    assert decompressFromBase64(compressed + '!' + compressed) == text
@@ -1,19 +1,75 @@
+import io
+import signal
+import asyncio
+import gzip
 import json
 import os
+import time
+import tracemalloc
+import base64
+import pytest
+import tarfile
+import zipfile
+import subprocess
+import threading
+import sys
+import pydicom
+import numpy as np
 
 from fastapi.testclient import TestClient
 from fastapi import status
-from main import app, ACCESS_TOKEN_ENV_KEY
+from PIL import Image
+from attributes.reader import AttributesReader
+from caching.cache import ResultCache
+from compression.decompressor import Decompressor
+from execution.admission import AdmissionController
+from concurrent.futures.process import BrokenProcessPool
+from execution.executor import Executor
+from execution import transport as transport_module
+from execution.transport import SharedMemoryTransport
+from jobs.store import JobStore, JobStoreFullError
+from main import app, ACCESS_TOKEN_ENV_KEY, ATTRIBUTES_HEADER
+
+import main
 
 
 main_url = '/'
 convert_url = '/convert'
+convert_binary_url = '/convert/binary'
+convert_batch_url = '/convert/batch'
+metrics_url = '/metrics'
+attributes_url = '/attributes'
+jobs_url = '/jobs'
+convert_archive_url = '/convert/archive'
+ready_url = '/ready'
 access_token = 'access_token'
 client = TestClient(app)
 
+
+def multi_frame_dicom(frames: int) -> bytes:
+    dataset = pydicom.Dataset()
+    dataset.file_meta = pydicom.dataset.FileMetaDataset()
+    dataset.file_meta.TransferSyntaxUID = pydicom.uid.ExplicitVRLittleEndian
+    dataset.file_meta.MediaStorageSOPClassUID = pydicom.uid.generate_uid()
+    dataset.file_meta.MediaStorageSOPInstanceUID = pydicom.uid.generate_uid()
+    dataset.Rows, dataset.Columns, dataset.NumberOfFrames = 4, 6, frames
+    dataset.PixelSpacing = [0.5, 0.5]
+    dataset.SamplesPerPixel, dataset.PhotometricInterpretation = 1, 'MONOCHROME2'
+    dataset.BitsAllocated, dataset.BitsStored, dataset.HighBit, dataset.PixelRepresentation = 16, 16, 15, 0
+    dataset.PixelData = np.arange(frames * 24, dtype='<u2').tobytes()
+    buffer = io.BytesIO()
+    pydicom.dcmwrite(buffer, dataset, **{'enforce_file_format' if hasattr(pydicom, 'pixels') else 'write_like_original': True})
+    return buffer.getvalue()
+
 os.environ[ACCESS_TOKEN_ENV_KEY] = access_token
 
 
+@pytest.fixture(autouse=True)
+def disabled_cache(monkeypatch):
+    # Every test must run the whole pipeline, unless it enables the cache on its own.
+    monkeypatch.setattr(main, 'cache', ResultCache(budget=0))
+
+
 def test_main_request():
     resp = client.get(url=main_url)
     resp_body = json.loads(resp.content.decode())
@@ -124,3 +180,792 @@ def test_valid_request():
     assert resp_body.get('attributes') is not None
     assert resp_body.get('attributes').get('pixel_spacing') is not None
     assert resp_body.get('attributes').get('image_size') is not None
+
+
+def test_valid_request_in_process_mode(monkeypatch):
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = f.read()
+
+    executor = Executor(mode='process', workers=1)
+    monkeypatch.setattr(main, 'executor', executor)
+    try:
+        resp = client.post(
+            url=convert_url,
+            headers={
+                'Authorization': f'Bearer {access_token}'
+            },
+            json={
+                'encoded': True,
+                'compression': 'lz',
+                'image': data
+            }
+        )
+    finally:
+        executor.shutdown()
+    resp_body = json.loads(resp.content.decode())
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp_body.get('photo') is not None
+    assert resp_body.get('attributes').get('image_size') is not None
+
+
+def test_overloaded_request(monkeypatch):
+    executor = Executor(mode='process', workers=1, queue_size=0)
+    executor.pending = executor.capacity
+    monkeypatch.setattr(main, 'executor', executor)
+
+    resp = client.post(
+        url=convert_url,
+        headers={
+            'Authorization': f'Bearer {access_token}'
+        },
+        json={
+            'encoded': True,
+            'compression': 'lz',
+            'image': 'HelloWorld'
+        }
+    )
+
+    assert resp.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert resp.headers.get('Retry-After') is not None
+
+
+def test_executor_recovers_from_killed_idle_worker():
+    executor = Executor(mode='process', workers=1, queue_size=1)
+
+    async def submit() -> list:
+        results = []
+        for _ in range(4):
+            try:
+                results.append(await executor.submit(os.getpid))
+            except BrokenProcessPool:
+                results.append(None)
+        return results
+
+    try:
+        worker = asyncio.run(executor.submit(os.getpid))
+        os.kill(worker, signal.SIGKILL)
+        time.sleep(0.5)
+        results = asyncio.run(submit())
+    finally:
+        executor.shutdown()
+
+    # Only the job submitted to the broken pool fails, the following ones run in the new pool.
+    assert results.count(None) <= 1
+    assert all(pid not in (None, worker) for pid in results[-3:])
+    assert executor.pending == 0
+
+
+def test_registered_attribute_extractor(monkeypatch):
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = f.read()
+
+    class ModalityExtractor:
+        @staticmethod
+        def extract(dataset):
+            return str(dataset.get('Modality', ''))
+
+    monkeypatch.setitem(AttributesReader.extractors, 'modality', ModalityExtractor)
+    resp = client.post(
+        url=convert_url,
+        headers={
+            'Authorization': f'Bearer {access_token}'
+        },
+        json={
+            'encoded': True,
+            'compression': 'lz',
+            'image': data
+        }
+    )
+    resp_body = json.loads(resp.content.decode())
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp_body.get('attributes').get('modality') is not None
+
+
+def test_repeated_request_is_cached(monkeypatch, tmp_path):
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = f.read()
+
+    cache = ResultCache(budget=16 * 1024 * 1024, directory=str(tmp_path))
+    monkeypatch.setattr(main, 'cache', cache)
+    responses = [
+        client.post(
+            url=convert_url,
+            headers={
+                'Authorization': f'Bearer {access_token}'
+            },
+            json={
+                'encoded': True,
+                'compression': 'lz',
+                'image': data
+            }
+        )
+        for _ in range(2)
+    ]
+
+    assert all(resp.status_code == status.HTTP_200_OK for resp in responses)
+    assert responses[0].content == responses[1].content
+    assert cache.hits == 1
+    assert cache.misses == 1
+    # The on-disk tier survives the restart of the service.
+    restarted_cache = ResultCache(budget=16 * 1024 * 1024, directory=str(tmp_path))
+    keys = [path.name for path in tmp_path.iterdir()]
+    assert len(keys) == 1
+    assert asyncio.run(restarted_cache.get(keys[0])) is not None
+
+
+def test_cache_evicts_by_size():
+    cache = ResultCache(budget=100)
+
+    async def run() -> list:
+        await cache.put('first', {'photo': b'a' * 40, 'attributes': {}})
+        await cache.put('second', {'photo': b'b' * 40, 'attributes': {}})
+        await cache.put('third', {'photo': b'c' * 40, 'attributes': {}})
+        return [await cache.get(key) for key in ('first', 'second', 'third')]
+
+    first, second, third = asyncio.run(run())
+
+    assert first is None
+    assert second is not None
+    assert third is not None
+    assert cache.size <= cache.budget
+
+
+def test_cache_directory_evicts_least_recently_used(tmp_path):
+    result = {'photo': bytes(100), 'attributes': {}}
+
+    async def run():
+        cache = ResultCache(budget=1000, directory=str(tmp_path), directory_budget=300)
+        await cache.put('first', result)
+        await cache.put('second', result)
+        # The restarted cache reads the first file from the disk, which makes the second one the oldest.
+        restarted_cache = ResultCache(budget=1000, directory=str(tmp_path), directory_budget=300)
+        await restarted_cache.get('first')
+        await restarted_cache.put('third', result)
+        return restarted_cache
+
+    cache = asyncio.run(run())
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['first', 'third']
+    assert cache.directory_size <= cache.directory_budget
+
+
+def test_valid_binary_request():
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = Decompressor.decompress(f.read(), 'lz', True)
+
+    resp = client.post(
+        url=convert_binary_url,
+        headers={
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/octet-stream',
+            'Content-Encoding': 'gzip'
+        },
+        data=gzip.compress(data)
+    )
+    attributes = json.loads(resp.headers.get(ATTRIBUTES_HEADER))
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.headers.get('Content-Type') == 'image/png'
+    assert resp.content.startswith(b'\x89PNG')
+    assert attributes.get('pixel_spacing') is not None
+    assert attributes.get('image_size') is not None
+
+
+def test_unsupported_content_encoding_binary_request():
+    resp = client.post(
+        url=convert_binary_url,
+        headers={
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/octet-stream',
+            'Content-Encoding': 'unknown'
+        },
+        data=b'HelloWorld'
+    )
+
+    assert resp.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+
+
+def test_batch_request():
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = f.read()
+
+    resp = client.post(
+        url=convert_batch_url,
+        headers={
+            'Authorization': f'Bearer {access_token}'
+        },
+        json={
+            'items': [
+                {'encoded': True, 'compression': 'lz', 'image': data},
+                {'encoded': True, 'compression': 'unknown', 'image': data},
+                {'encoded': True, 'compression': 'lz', 'image': 'HelloWorld'}
+            ]
+        }
+    )
+    items = [json.loads(line) for line in resp.content.decode().splitlines()]
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert [item['index'] for item in items] == [0, 1, 2]
+    assert items[0]['status'] == status.HTTP_200_OK
+    assert items[0].get('photo') is not None
+    assert items[0].get('attributes').get('image_size') is not None
+    assert items[1]['status'] == status.HTTP_400_BAD_REQUEST
+    assert items[2]['status'] == status.HTTP_500_INTERNAL_SERVER_ERROR
+
+
+@pytest.mark.parametrize('window', ['dicom', 'lung', 'custom'])
+def test_windowed_request(window):
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = f.read()
+
+    resp = client.post(
+        url=convert_url,
+        headers={
+            'Authorization': f'Bearer {access_token}'
+        },
+        json={
+            'encoded': True,
+            'compression': 'lz',
+            'image': data,
+            'window': window,
+            'window_center': 40,
+            'window_width': 400
+        }
+    )
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert json.loads(resp.content.decode()).get('photo') is not None
+
+
+def test_invalid_window_request():
+    resp = client.post(
+        url=convert_url,
+        headers={
+            'Authorization': f'Bearer {access_token}'
+        },
+        json={
+            'encoded': True,
+            'compression': 'lz',
+            'image': 'HelloWorld',
+            'window': 'custom'
+        }
+    )
+
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_metrics_request():
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = f.read()
+
+    client.post(
+        url=convert_url,
+        headers={
+            'Authorization': f'Bearer {access_token}'
+        },
+        json={
+            'encoded': True,
+            'compression': 'lz',
+            'image': data
+        }
+    )
+    resp = client.get(url=metrics_url)
+    body = resp.content.decode()
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert 'dicom_stage_duration_seconds_count{stage="decompress"}' in body
+    assert 'dicom_stage_output_bytes_bucket{stage="convert",le="+Inf"}' in body
+    assert 'dicom_requests_total{compression="lz",endpoint="convert"}' in body
+    assert 'dicom_requests_in_flight 0' in body
+
+
+def test_unsupported_compression_metric_label():
+    for compression in ('bogus-0', 'bogus-1'):
+        client.post(
+            url=convert_url,
+            headers={'Authorization': f'Bearer {access_token}'},
+            json={'encoded': True, 'compression': compression, 'image': 'HelloWorld'}
+        )
+    body = client.get(url=metrics_url).content.decode()
+
+    assert 'dicom_requests_total{compression="unsupported",endpoint="convert"}' in body
+    assert 'bogus' not in body
+
+
+def test_attributes_request():
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = f.read()
+
+    resp = client.post(
+        url=attributes_url,
+        headers={
+            'Authorization': f'Bearer {access_token}'
+        },
+        json={
+            'encoded': True,
+            'compression': 'lz',
+            'image': data,
+            'attributes': ['image_size', 'Rows', 'SOPClassUID']
+        }
+    )
+    resp_body = json.loads(resp.content.decode())
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp_body.get('photo') is None
+    assert resp_body['attributes']['image_size'][1] == resp_body['attributes']['Rows']
+    assert set(resp_body['attributes']) == {'image_size', 'Rows', 'SOPClassUID'}
+
+
+def test_attributes_only_convert_request():
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = f.read()
+
+    resp = client.post(
+        url=convert_url,
+        headers={
+            'Authorization': f'Bearer {access_token}'
+        },
+        json={
+            'encoded': True,
+            'compression': 'lz',
+            'image': data,
+            'attributes_only': True
+        }
+    )
+    resp_body = json.loads(resp.content.decode())
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp_body.get('photo') is None
+    assert resp_body['attributes'].get('pixel_spacing') is not None
+
+
+def test_unsupported_attribute_request():
+    resp = client.post(
+        url=attributes_url,
+        headers={
+            'Authorization': f'Bearer {access_token}'
+        },
+        json={
+            'encoded': True,
+            'compression': 'lz',
+            'image': 'HelloWorld',
+            'attributes': ['unknown']
+        }
+    )
+
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_preview_request():
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = f.read()
+
+    resp = client.post(
+        url=convert_url,
+        headers={
+            'Authorization': f'Bearer {access_token}'
+        },
+        json={
+            'encoded': True,
+            'compression': 'lz',
+            'image': data,
+            'max_width': 64,
+            'max_height': 64
+        }
+    )
+    photo = Image.open(io.BytesIO(base64.b64decode(json.loads(resp.content.decode())['photo'])))
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert max(photo.size) == 64
+
+
+@pytest.mark.parametrize('output_format, media_type', [
+    ('jpeg', 'image/jpeg'),
+    ('webp', 'image/webp'),
+    ('raw', 'image/x-portable-anymap')
+])
+def test_binary_request_output_format(output_format, media_type):
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = Decompressor.decompress(f.read(), 'lz', True)
+
+    resp = client.post(
+        url=f'{convert_binary_url}?format={output_format}&quality=50',
+        headers={
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/octet-stream'
+        },
+        data=bytes(data)
+    )
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.headers.get('Content-Type') == media_type
+    assert Image.open(io.BytesIO(resp.content)).size == tuple(json.loads(resp.headers[ATTRIBUTES_HEADER])['image_size'])
+
+
+def test_multi_frame_request():
+    data = base64.b64encode(multi_frame_dicom(3)).decode()
+
+    resp = client.post(
+        url=convert_url,
+        headers={
+            'Authorization': f'Bearer {access_token}'
+        },
+        json={
+            'encoded': True,
+            'compression': 'none',
+            'image': data,
+            'frames': '1:'
+        }
+    )
+    lines = [json.loads(line) for line in resp.content.decode().splitlines()]
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert lines[0]['attributes']['image_size'] == [6, 4]
+    assert [line['frame'] for line in lines[1:]] == [1, 2]
+    assert Image.open(io.BytesIO(base64.b64decode(lines[1]['photo']))).size == (6, 4)
+
+
+def test_frames_out_of_range_request():
+    resp = client.post(
+        url=f'{convert_binary_url}?frames=3',
+        headers={
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/octet-stream'
+        },
+        data=multi_frame_dicom(3)
+    )
+
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_job_request(monkeypatch):
+    monkeypatch.setattr(main, 'jobs', JobStore(capacity=4, ttl=60))
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = f.read()
+
+    # Context manager keeps the event loop running between the requests, so the job can run.
+    with TestClient(app) as job_client:
+        headers = {'Authorization': f'Bearer {access_token}'}
+        resp = job_client.post(
+            url=jobs_url,
+            headers=headers,
+            json={'encoded': True, 'compression': 'lz', 'image': data, 'priority': 1}
+        )
+        job_id = resp.json()['id']
+        for _ in range(100):
+            if job_client.get(f'{jobs_url}/{job_id}', headers=headers).json()['status'] in ('done', 'failed'):
+                break
+            time.sleep(0.05)
+        result_resp = job_client.get(f'{jobs_url}/{job_id}/result', headers=headers)
+        missing_resp = job_client.get(f'{jobs_url}/missing', headers=headers)
+
+    assert resp.status_code == status.HTTP_202_ACCEPTED
+    assert result_resp.status_code == status.HTTP_200_OK
+    assert result_resp.json()['photo'] is not None
+    assert missing_resp.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_job_store_priority_and_eviction():
+    store = JobStore(capacity=2, ttl=60)
+    low = store.create('low', priority=0)
+    high = store.create('high', priority=5)
+
+    assert store.next() is high
+    with pytest.raises(JobStoreFullError):
+        store.create('third')
+    store.finish(high, {'attributes': {}})
+    third = store.create('third')
+    assert store.get(high.id) is None
+    assert store.next() is low
+    assert store.next() is third
+
+
+def test_not_admitted_request(monkeypatch):
+    monkeypatch.setattr(main, 'admission', AdmissionController(budget=1024, timeout=0))
+    # Memory is reserved by other conversion, so the large study does not fit the budget.
+    main.admission.used = 1
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = f.read()
+
+    resp = client.post(
+        url=convert_url,
+        headers={
+            'Authorization': f'Bearer {access_token}'
+        },
+        json={
+            'encoded': True,
+            'compression': 'lz',
+            'image': data
+        }
+    )
+
+    assert resp.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert resp.headers.get('Retry-After') is not None
+    assert main.admission.used == 1
+
+
+def test_admitted_request_releases_memory(monkeypatch):
+    monkeypatch.setattr(main, 'admission', AdmissionController(budget=1 << 30, timeout=0))
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = f.read()
+
+    resp = client.post(
+        url=convert_url,
+        headers={
+            'Authorization': f'Bearer {access_token}'
+        },
+        json={
+            'encoded': True,
+            'compression': 'lz',
+            'image': data
+        }
+    )
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert main.admission.used == 0
+
+
+@pytest.mark.parametrize('attributes_only', [False, True])
+def test_streamed_request(attributes_only):
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = f.read()
+    request = {'encoded': True, 'compression': 'lz', 'image': data, 'attributes_only': attributes_only}
+
+    resp = client.post(url=convert_url, headers={'Authorization': f'Bearer {access_token}'}, json=request)
+    streamed_resp = client.post(
+        url=convert_url,
+        headers={'Authorization': f'Bearer {access_token}'},
+        json={**request, 'stream': True}
+    )
+
+    assert streamed_resp.status_code == status.HTTP_200_OK
+    assert int(streamed_resp.headers['Content-Length']) == len(streamed_resp.content)
+    assert streamed_resp.content.startswith(b'{"attributes"')
+    assert streamed_resp.json() == resp.json()
+
+
+def test_debug_allocations_request(monkeypatch):
+    monkeypatch.setattr(main, 'trace_allocations', True)
+    data = base64.b64encode(multi_frame_dicom(1)).decode()
+
+    resp = client.post(
+        url=convert_url,
+        headers={
+            'Authorization': f'Bearer {access_token}'
+        },
+        json={
+            'encoded': True,
+            'compression': 'none',
+            'image': data
+        }
+    )
+    metrics_resp = client.get(metrics_url)
+
+    tracemalloc.stop()
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert 'dicom_stage_allocated_bytes_count{stage="parse"}' in metrics_resp.content.decode()
+
+
+def test_shared_memory_transport_request(monkeypatch):
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = f.read()
+    executor = Executor(mode='process', workers=1)
+    transport = SharedMemoryTransport(max_segments=2)
+    monkeypatch.setattr(main, 'executor', executor)
+    monkeypatch.setattr(main, 'transport', transport)
+    request = {'encoded': True, 'compression': 'lz', 'image': data}
+
+    try:
+        responses = [
+            client.post(url=convert_url, headers={'Authorization': f'Bearer {access_token}'}, json=request)
+            for _ in range(2)
+        ]
+    finally:
+        executor.shutdown()
+        transport.close()
+    monkeypatch.setattr(main, 'executor', Executor())
+    monkeypatch.setattr(main, 'transport', None)
+    inline_resp = client.post(url=convert_url, headers={'Authorization': f'Bearer {access_token}'}, json=request)
+
+    assert [resp.status_code for resp in responses] == [status.HTTP_200_OK] * 2
+    assert responses[0].json() == responses[1].json() == inline_resp.json()
+
+
+def test_non_ascii_image_with_shared_memory_transport(monkeypatch):
+    executor = Executor(mode='process', workers=1)
+    transport = SharedMemoryTransport(max_segments=2)
+    monkeypatch.setattr(main, 'executor', executor)
+    monkeypatch.setattr(main, 'transport', transport)
+    request = {'encoded': True, 'compression': 'lz', 'image': 'Zażółć'}
+
+    try:
+        resp = client.post(url=convert_url, headers={'Authorization': f'Bearer {access_token}'}, json=request)
+    finally:
+        executor.shutdown()
+        transport.close()
+    monkeypatch.setattr(main, 'executor', Executor())
+    monkeypatch.setattr(main, 'transport', None)
+    inline_resp = client.post(url=convert_url, headers={'Authorization': f'Bearer {access_token}'}, json=request)
+
+    assert resp.status_code == inline_resp.status_code
+    assert resp.json() == inline_resp.json()
+
+
+def test_failed_job_segments_are_reused(monkeypatch):
+    executor = Executor(mode='process', workers=1)
+    transport = SharedMemoryTransport(max_segments=2)
+    create = transport_module.SharedMemory
+    created = []
+
+    def counting_create(*args, **kwargs):
+        created.append(create(*args, **kwargs))
+        return created[-1]
+
+    monkeypatch.setattr(main, 'executor', executor)
+    monkeypatch.setattr(main, 'transport', transport)
+    monkeypatch.setattr(transport_module, 'SharedMemory', counting_create)
+    request = {'encoded': True, 'compression': 'lz', 'image': 'not a dicom'}
+
+    try:
+        statuses = [
+            client.post(url=convert_url, headers={'Authorization': f'Bearer {access_token}'}, json=request).status_code
+            for _ in range(2)
+        ]
+    finally:
+        executor.shutdown()
+        transport.close()
+
+    # Worker finished the failed job, so its segments went back to the pool.
+    assert statuses == [status.HTTP_500_INTERNAL_SERVER_ERROR] * 2
+    assert len(created) == 2
+
+
+def test_failed_target_segment_releases_source(monkeypatch):
+    transport = SharedMemoryTransport(max_segments=2)
+    create = transport_module.SharedMemory
+    created = []
+
+    def failing_create(*args, **kwargs):
+        if created:
+            raise OSError('No space left on device')
+        created.append(create(*args, **kwargs))
+        return created[-1]
+
+    monkeypatch.setattr(transport_module, 'SharedMemory', failing_create)
+    try:
+        with pytest.raises(OSError):
+            transport.acquire('payload')
+        monkeypatch.setattr(transport_module, 'SharedMemory', create)
+        source, target = transport.acquire('payload')
+    finally:
+        transport.close()
+
+    # Source segment of the failed acquisition was put back into the pool and reused.
+    assert source.name == created[0].name
+    assert target.name != source.name
+
+
+def test_ready_after_warm_up(monkeypatch):
+    monkeypatch.setattr(main, 'warm_up', True)
+    monkeypatch.setattr(main, 'readiness', {'ready': False, 'warm_up_seconds': None})
+
+    # Context manager runs the startup event, which schedules the warm-up.
+    with TestClient(app) as warm_up_client:
+        statuses = [warm_up_client.get(ready_url).status_code]
+        for _ in range(100):
+            if statuses[-1] == status.HTTP_200_OK:
+                break
+            time.sleep(0.05)
+            statuses.append(warm_up_client.get(ready_url).status_code)
+        resp = warm_up_client.get(ready_url)
+
+    assert set(statuses) <= {status.HTTP_200_OK, status.HTTP_503_SERVICE_UNAVAILABLE}
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.json()['warm_up_seconds'] > 0
+
+
+def test_inline_warm_up_does_not_block_requests(monkeypatch):
+    from pipeline import pipeline
+    released = threading.Event()
+    monkeypatch.setattr(pipeline, 'warm_up', lambda: released.wait(5))
+    monkeypatch.setattr(main, 'warm_up', True)
+    monkeypatch.setattr(main, 'readiness', {'ready': False, 'warm_up_seconds': None})
+
+    with TestClient(app) as warm_up_client:
+        resp = warm_up_client.get('/')
+        readiness = warm_up_client.get(ready_url)
+        released.set()
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert readiness.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+def test_import_does_not_load_heavy_modules():
+    code = 'import sys, main; print(",".join(m for m in ("numpy", "pydicom", "PIL") if m in sys.modules))'
+    process = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+
+    assert process.stdout.strip() == ''
+
+
+def test_archive_request():
+    with open('test/data/valid_base64_lz_compressed_dcm.txt') as f:
+        data = bytes(Decompressor.decompress(f.read(), 'lz', True))
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as study:
+        study.writestr('study/1.dcm', data)
+        study.writestr('study/2', multi_frame_dicom(2))
+        study.writestr('study/broken.dcm', b'not a dicom')
+
+    resp = client.post(
+        url=convert_archive_url,
+        params={'frames': 'all'},
+        headers={'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/zip'},
+        data=archive.getvalue()
+    )
+    result = zipfile.ZipFile(io.BytesIO(resp.content))
+    manifest = {entry['name']: entry for entry in json.loads(result.read('manifest.json'))['files']}
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.headers.get('Content-Type') == 'application/zip'
+    assert list(manifest) == ['study/1.dcm', 'study/2', 'study/broken.dcm']
+    assert manifest['study/1.dcm']['files'] == ['study/1/0.png']
+    assert manifest['study/1.dcm']['attributes'].get('pixel_spacing') is not None
+    assert manifest['study/2']['files'] == ['study/2/0.png', 'study/2/1.png']
+    assert manifest['study/broken.dcm']['status'] == status.HTTP_500_INTERNAL_SERVER_ERROR
+    assert all(result.read(name).startswith(b'\x89PNG') for name in manifest['study/2']['files'])
+
+
+def test_tar_archive_request():
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w') as study:
+        info = tarfile.TarInfo('IM0001.DCM')
+        data = multi_frame_dicom(1)
+        info.size = len(data)
+        study.addfile(info, io.BytesIO(data))
+
+    resp = client.post(
+        url=convert_archive_url,
+        headers={'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/x-tar'},
+        data=archive.getvalue()
+    )
+    result = tarfile.open(fileobj=io.BytesIO(resp.content))
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert result.getnames() == ['IM0001.png', 'manifest.json']
+
+
+@pytest.mark.parametrize('content_type, data, status_code', [
+    ('application/zip', b'not an archive', status.HTTP_400_BAD_REQUEST),
+    ('application/octet-stream', b'', status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+])
+def test_invalid_archive_request(content_type, data, status_code):
+    resp = client.post(
+        url=convert_archive_url,
+        headers={'Authorization': f'Bearer {access_token}', 'Content-Type': content_type},
+        data=data
+    )
+
+    assert resp.status_code == status_code
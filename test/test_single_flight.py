@@ -0,0 +1,41 @@
+import asyncio
+import pytest
+
+from caching.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_computation():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {'photo': b'photo'}
+
+    async def run():
+        return await asyncio.gather(*(single_flight.run('key', compute) for _ in range(3)))
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert single_flight.coalesced == 2
+    assert len(single_flight) == 0
+
+
+def test_concurrent_calls_share_error():
+    single_flight = SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        raise ValueError('invalid image')
+
+    async def run():
+        return await asyncio.gather(*(single_flight.run('key', compute) for _ in range(2)), return_exceptions=True)
+
+    errors = asyncio.run(run())
+
+    assert all(isinstance(error, ValueError) for error in errors)
+    with pytest.raises(ValueError):
+        asyncio.run(single_flight.run('key', compute))